@@ -0,0 +1,295 @@
+"""Правила оповещения по скользящей статистике каналов и их пошаговая проверка"""
+from dataclasses import dataclass
+import time
+
+# Результат проверки правила: условие выполнено, условие снято; None - оставить прежнее состояние
+FIRING = "firing"
+CLEAR = "clear"
+
+# Статистики окна, по которым может срабатывать правило
+STATISTICS = ("mean", "min", "max", "last")
+_STAT_TITLES = {"mean": "Среднее", "min": "Минимум", "max": "Максимум"}
+
+
+@dataclass
+class AlertEvent:
+    """Смена состояния правила на устройстве: срабатывание (active=True) или возврат к норме"""
+    rule: object
+    device: object
+    active: bool
+    value: float
+    timestamp: float
+
+    @property
+    def channel(self):
+        return self.rule.channel
+
+    @property
+    def kind(self):
+        return self.rule.kind
+
+    def details(self):
+        return self.rule.details(self)
+
+
+@dataclass
+class ThresholdRule:
+    """Статистика окна ниже below (или выше above) с гистерезисом: снимается только за порогом reset"""
+    name: str
+    channel: str
+    window: str = "1h"
+    statistic: str = "mean"
+    below: float = None
+    above: float = None
+    reset: float = None
+    min_coverage: float = 0.0
+    title: str = None
+
+    kind = "threshold"
+
+    def __post_init__(self):
+        if (self.below is None) == (self.above is None):
+            raise ValueError(f"Правило {self.name}: нужно задать ровно один из порогов below или above")
+        if self.statistic not in STATISTICS:
+            raise ValueError(f"Правило {self.name}: неизвестная статистика '{self.statistic}'")
+        if self.reset is None:
+            self.reset = self.below if self.below is not None else self.above
+
+    @property
+    def channels(self):
+        return (self.channel,)
+
+    def evaluate(self, device, now):
+        history = device.histories[self.channel]
+        if history.last is None:
+            return None, None
+        if self.statistic == "last":
+            value = history.last
+            covered = True
+        else:
+            window = history.window(self.window)
+            if not window.count:
+                return None, None
+            value = window.mean if self.statistic == "mean" else getattr(window, self.statistic)
+            covered = window.weight >= window.duration * self.min_coverage
+
+        if self.below is not None:
+            if value < self.below and covered:
+                return FIRING, value
+            return (CLEAR if value >= self.reset else None), value
+        if value > self.above and covered:
+            return FIRING, value
+        return (CLEAR if value <= self.reset else None), value
+
+    def details(self, event):
+        label = "Текущее значение" if self.statistic == "last" else f"{_STAT_TITLES[self.statistic]} за {self.window}"
+        if not event.active:
+            return f"{label}: {event.value:.1f} (порог сброса: {self.reset:.1f})"
+        limit = f"Минимально допустимое: {self.below:.1f}" if self.below is not None else \
+            f"Максимально допустимое: {self.above:.1f}"
+        return f"{label}: {event.value:.1f}\n{limit}"
+
+
+@dataclass
+class RateOfChangeRule:
+    """Скорость изменения за окно (в единицах в минуту) вышла за max_rise или max_drop.
+
+    Снимается, когда скорость вернулась в пределы reset_fraction от порога.
+    """
+    name: str
+    channel: str
+    window: str = "5m"
+    max_rise: float = None
+    max_drop: float = None
+    reset_fraction: float = 0.5
+    min_span: float = 0.5
+    title: str = None
+
+    kind = "rate"
+
+    def __post_init__(self):
+        if self.max_rise is None and self.max_drop is None:
+            raise ValueError(f"Правило {self.name}: нужно задать max_rise и/или max_drop")
+
+    @property
+    def channels(self):
+        return (self.channel,)
+
+    def evaluate(self, device, now):
+        history = device.histories[self.channel]
+        window = history.window(self.window)
+        if window.count < 2:
+            return None, None
+        span = history.last_time - window.first_time
+        # Пока окно заполнено меньше чем на min_span, скорость по двум точкам слишком шумная
+        if span < window.duration * self.min_span:
+            return None, None
+        rate = (history.last - window.first_value) / span * 60
+
+        if (self.max_rise is not None and rate > self.max_rise) or \
+                (self.max_drop is not None and -rate > self.max_drop):
+            return FIRING, rate
+        within_rise = self.max_rise is None or rate <= self.max_rise * self.reset_fraction
+        within_drop = self.max_drop is None or -rate <= self.max_drop * self.reset_fraction
+        return (CLEAR if within_rise and within_drop else None), rate
+
+    def details(self, event):
+        text = f"Скорость изменения за {self.window}: {event.value:+.2f} в минуту"
+        if event.active:
+            limits = []
+            if self.max_rise is not None:
+                limits.append(f"рост не более {self.max_rise:.2f}")
+            if self.max_drop is not None:
+                limits.append(f"падение не более {self.max_drop:.2f}")
+            text += f"\nДопустимо: {', '.join(limits)} в минуту"
+        return text
+
+
+@dataclass
+class StaleRule:
+    """Нет новых данных канала дольше max_age секунд (проверяется и по таймеру, без измерений)"""
+    name: str
+    channel: str
+    max_age: float = 600.0
+    title: str = None
+
+    kind = "stale"
+
+    @property
+    def channels(self):
+        return (self.channel,)
+
+    def evaluate(self, device, now):
+        last_time = device.histories[self.channel].last_time
+        age = now - (last_time if last_time is not None else device.alerts.started)
+        return (FIRING if age > self.max_age else CLEAR), age
+
+    def details(self, event):
+        if event.active:
+            return f"Нет данных {event.value / 60:.0f} мин (допустимо {self.max_age / 60:.0f} мин)"
+        return "Данные снова поступают"
+
+
+@dataclass
+class DeviationRule:
+    """Статистики окна двух каналов устройства расходятся больше чем на max_delta"""
+    name: str
+    channel: str
+    other: str
+    max_delta: float
+    window: str = "5m"
+    statistic: str = "mean"
+    reset: float = None
+    title: str = None
+
+    kind = "deviation"
+
+    def __post_init__(self):
+        if self.statistic not in STATISTICS:
+            raise ValueError(f"Правило {self.name}: неизвестная статистика '{self.statistic}'")
+        if self.reset is None:
+            self.reset = self.max_delta
+
+    @property
+    def channels(self):
+        return self.channel, self.other
+
+    def _value(self, history):
+        if self.statistic == "last":
+            return history.last
+        window = history.window(self.window)
+        if not window.count:
+            return None
+        return window.mean if self.statistic == "mean" else getattr(window, self.statistic)
+
+    def evaluate(self, device, now):
+        first = self._value(device.histories[self.channel])
+        second = self._value(device.histories[self.other])
+        if first is None or second is None:
+            return None, None
+        delta = abs(first - second)
+        if delta > self.max_delta:
+            return FIRING, delta
+        return (CLEAR if delta <= self.reset else None), delta
+
+    def details(self, event):
+        text = f"Расхождение каналов {self.channel} и {self.other}: {event.value:.1f}"
+        if event.active:
+            text += f" (допустимо {self.max_delta:.1f})"
+        return text
+
+
+# Типы правил для конфигурации: type -> класс
+RULE_TYPES = {
+    "threshold": ThresholdRule,
+    "rate": RateOfChangeRule,
+    "stale": StaleRule,
+    "deviation": DeviationRule,
+}
+
+
+def parse_rule(raw):
+    """Создает правило из словаря конфигурации с ключом type"""
+    settings = dict(raw)
+    rule_type = settings.pop("type", None)
+    if rule_type not in RULE_TYPES:
+        raise ValueError(f"Неизвестный тип правила '{rule_type}', доступны: {', '.join(RULE_TYPES)}")
+    return RULE_TYPES[rule_type](**settings)
+
+
+class AlertEngine:
+    """Правила одного устройства с индексом по каналам.
+
+    На новое измерение проверяются только правила обновленных каналов, каждое за O(1)
+    по готовой статистике окон; состояние каждого правила - один флаг.
+    """
+
+    def __init__(self, rules, channel_names=None):
+        names = [rule.name for rule in rules]
+        if len(names) != len(set(names)):
+            raise ValueError("Имена правил оповещения устройства должны быть уникальными")
+        self.rules = list(rules)
+        self.active = {}
+        self.started = time.time()
+        self._by_channel = {}
+        for rule in self.rules:
+            for channel in rule.channels:
+                if channel_names is not None and channel not in channel_names:
+                    raise ValueError(f"Правило {rule.name}: у устройства нет канала '{channel}'")
+                self._by_channel.setdefault(channel, []).append(rule)
+        self._timed = [rule for rule in self.rules if isinstance(rule, StaleRule)]
+
+    def _check(self, rule, device, now):
+        state, value = rule.evaluate(device, now)
+        active = self.active.get(rule.name, False)
+        if state == FIRING and not active:
+            self.active[rule.name] = True
+            return AlertEvent(rule, device, True, value, now)
+        if state == CLEAR and active:
+            self.active[rule.name] = False
+            return AlertEvent(rule, device, False, value, now)
+        return None
+
+    def on_sample(self, device, channel_names, now):
+        """Проверяет правила каналов, получивших измерение; возвращает список AlertEvent"""
+        events = []
+        checked = set()
+        for channel in channel_names:
+            for rule in self._by_channel.get(channel, ()):
+                # Правило по двум каналам проверяется один раз за цикл
+                if rule.name in checked:
+                    continue
+                checked.add(rule.name)
+                event = self._check(rule, device, now)
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def on_tick(self, device, now):
+        """Проверяет правила, которым не нужны новые измерения (отсутствие данных)"""
+        events = []
+        for rule in self._timed:
+            event = self._check(rule, device, now)
+            if event is not None:
+                events.append(event)
+        return events
@@ -0,0 +1,218 @@
+"""Нагрузочные замеры опроса и отчетов на локальном имитаторе Modbus
+
+Для каждой комбинации числа устройств и каналов поднимает имитатор, опрашивает его
+планировщиком парка с настоящей обработкой измерений (process_sample из main.py) и выводит:
+измерений в секунду, p50/p99 длительности цикла, память истории на канал, время
+формирования отчета /temperature по снимку парка и время ответа из кэша отчетов.
+
+Запуск: python benchmark.py --devices 1,10,50 --channels 2,16,64 --duration 5 --output bench_output.txt
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# main.py при импорте создает журнал измерений: в замерах он пишется во временный каталог
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="bench_")
+os.environ.pop("FLEET_CONFIG", None)
+os.environ.setdefault("TELEGRAM_CHAT_ID", "0")
+
+from loguru import logger
+
+import main as bot
+from fleet import Device, DeviceConfig, FleetScheduler
+from modbus_simulator import FaultProfile, ModbusSimulator, SimulatedDevice, Waveform
+from register_map import RegisterChannel
+from rolling_stats import ChannelHistory
+
+# Сколько раз формировать отчет для усреднения
+REPORT_REPEATS = 50
+
+
+def make_channels(count):
+    """Каналы float32 подряд, начиная с регистра 0"""
+    channels = [RegisterChannel(name=f"ch{index}", title=f"Канал {index}", address=2 * index) for index in range(count)]
+    # Канал низкой температуры нужен, чтобы в замер попадала проверка правил оповещения
+    channels[0] = RegisterChannel(name=bot.LOW_TEMP_CHANNEL, title="Температура подачи СО", address=0)
+    return channels
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def memory_per_channel(channels, sample_period):
+    """Байт памяти на канал для истории, заполненной на всю длину самого длинного окна"""
+    rng = random.Random(0)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    histories = [ChannelHistory(bot.HISTORY_WINDOWS, sample_period) for _ in range(channels)]
+    samples = int(max(bot.HISTORY_WINDOWS.values()) / sample_period)
+    for history in histories:
+        for index in range(samples):
+            history.append(rng.gauss(40.0, 5.0), index * sample_period)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / channels
+
+
+async def run_scenario(devices_count, channels_count, args):
+    """Один замер: devices_count устройств по channels_count каналов на одном шлюзе"""
+    channels = make_channels(channels_count)
+    faults = FaultProfile(args.latency, args.jitter, args.error_rate, args.disconnect_rate)
+    simulated = {
+        unit_id: SimulatedDevice(
+            channels, {channel.name: Waveform("sine", period=60.0, phase=random.random(), noise=0.5) for channel in channels},
+            faults, seed=unit_id,
+        )
+        for unit_id in range(1, devices_count + 1)
+    }
+    simulator = ModbusSimulator(simulated, port=0)
+    await simulator.start()
+
+    devices = [
+        Device(DeviceConfig(name=f"dev{unit_id}", title=f"Устройство {unit_id}", host=simulator.host,
+                            port=simulator.port, unit_id=unit_id, poll_interval=args.interval,
+                            timeout=args.timeout, channels=channels,
+                            alerts=bot.default_alert_rules({channel.name for channel in channels})),
+               bot.HISTORY_WINDOWS)
+        for unit_id in simulated
+    ]
+    scheduler = FleetScheduler(devices, args.max_in_flight)
+    bot.fleet = scheduler
+
+    # Длительность каждого цикла опроса, включая обработку измерений
+    cycles = []
+    poll_device = scheduler.poll_device
+
+    async def timed_poll(device):
+        started = time.perf_counter()
+        await poll_device(device)
+        cycles.append(time.perf_counter() - started)
+
+    scheduler.poll_device = timed_poll
+
+    samples = 0
+
+    async def on_sample(device, values, timestamp):
+        nonlocal samples
+        samples += len(values)
+        await bot.process_sample(device, values, timestamp)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Разогрев: все соединения пула устанавливаются до начала замера
+        scheduler.start(on_sample)
+        await asyncio.sleep(args.interval * (args.max_in_flight + 1))
+        samples = 0
+        cycles.clear()
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        elapsed = time.perf_counter() - started
+        measured_samples, measured_cycles = samples, list(cycles)
+        await scheduler.stop()
+        await simulator.stop()
+
+        # Формирование текста замеряется напрямую: через generate_temperature_report
+        # все повторы, кроме первого, были бы попаданиями в кэш отчетов
+        title = "🌡️ Текущая температура отопления"
+        snapshot = bot.fleet.snapshots.current
+        report_started = time.perf_counter()
+        for _ in range(REPORT_REPEATS):
+            bot.render_temperature_report(title, None, None, snapshot)
+        report_time = (time.perf_counter() - report_started) / REPORT_REPEATS
+
+        bot.generate_temperature_report(title)
+        cached_started = time.perf_counter()
+        for _ in range(REPORT_REPEATS):
+            bot.generate_temperature_report(title)
+        cached_time = (time.perf_counter() - cached_started) / REPORT_REPEATS
+
+    bot.sample_store.pending.clear()
+    return {
+        "devices": devices_count,
+        "channels": channels_count,
+        "samples_per_sec": measured_samples / elapsed,
+        "cycles": len(measured_cycles),
+        "p50": percentile(measured_cycles, 0.5),
+        "p99": percentile(measured_cycles, 0.99),
+        "missed": sum(device.missed_cycles for device in devices),
+        "report": report_time,
+        "cached": cached_time,
+    }
+
+
+def format_row(result, memory):
+    return (
+        f"{result['devices']:>7} {result['channels']:>7} {result['samples_per_sec']:>11.1f} "
+        f"{result['cycles']:>7} {result['p50'] * 1000:>9.2f} {result['p99'] * 1000:>9.2f} "
+        f"{result['missed']:>6} {memory / 1024:>10.1f} {result['report'] * 1000:>10.3f} {result['cached'] * 1000:>10.4f}"
+    )
+
+
+async def run(args):
+    header = (
+        f"{'devices':>7} {'chans':>7} {'samples/s':>11} {'cycles':>7} {'p50 ms':>9} {'p99 ms':>9} "
+        f"{'missed':>6} {'KiB/chan':>10} {'report ms':>10} {'cached ms':>10}"
+    )
+    lines = [
+        f"# interval={args.interval}s duration={args.duration}s latency={args.latency}s "
+        f"jitter={args.jitter}s errors={args.error_rate} disconnects={args.disconnect_rate} "
+        f"max_in_flight={args.max_in_flight}",
+        header,
+    ]
+    print("\n".join(lines), flush=True)
+    memory_cache = {}
+    for channels in args.channels:
+        if channels not in memory_cache:
+            memory_cache[channels] = memory_per_channel(channels, bot.POLL_INTERVAL)
+        for devices in args.devices:
+            result = await run_scenario(devices, channels, args)
+            line = format_row(result, memory_cache[channels])
+            print(line, flush=True)
+            lines.append(line)
+    return lines
+
+
+def parse_counts(text):
+    return [int(item) for item in text.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры опроса Modbus и формирования отчетов на имитаторе")
+    parser.add_argument("--devices", type=parse_counts, default=[1, 10, 50], help="число устройств через запятую")
+    parser.add_argument("--channels", type=parse_counts, default=[2, 16, 64], help="число каналов через запятую")
+    parser.add_argument("--duration", type=float, default=5.0, help="длительность замера, сек")
+    parser.add_argument("--interval", type=float, default=0.5, help="период опроса устройства, сек")
+    parser.add_argument("--timeout", type=float, default=1.0, help="таймаут запроса, сек")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="одновременных запросов к шлюзу")
+    parser.add_argument("--latency", type=float, default=0.002, help="задержка ответа имитатора, сек")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="файл для сохранения таблицы (например, bench_output.txt)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # Журналы не должны влиять на замер
+    logger.remove()
+    logging.getLogger("pymodbus").setLevel(logging.CRITICAL)
+
+    lines = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
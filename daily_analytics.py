@@ -0,0 +1,204 @@
+"""Сводная аналитика за сутки и неделю по сырым измерениям журнала на NumPy
+
+Измерения всех каналов загружаются в один непрерывный буфер (каналы подряд), и все
+показатели считаются пакетно по сегментам буфера: reduceat, bincount и одна сортировка
+на весь буфер для процентилей, без циклов Python по измерениям.
+"""
+import numpy as np
+
+from rolling_stats import MAX_GAP_PERIODS
+
+# Процентили в сводке
+PERCENTILES = (5, 50, 95)
+
+# Периоды сводки: название -> длительность, сек (сырые измерения хранятся 8 суток)
+SUMMARY_PERIODS = {"24h": 24 * 60 * 60, "7d": 7 * 24 * 60 * 60}
+
+# Минимум общих измерений пары каналов для расчета корреляции
+MIN_CORRELATION_SAMPLES = 3
+
+
+class SeriesBatch:
+    """Измерения нескольких каналов в одном буфере: канал i занимает [starts[i], starts[i] + counts[i])"""
+
+    def __init__(self, keys, arrays):
+        self.keys = list(keys)
+        self.index = {key: position for position, key in enumerate(self.keys)}
+        self.counts = np.array([len(array) for array in arrays], dtype=np.int64)
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1])).astype(np.int64)
+        data = np.concatenate(arrays) if arrays else np.empty((0, 2))
+        self.times = np.ascontiguousarray(data[:, 0])
+        self.values = np.ascontiguousarray(data[:, 1])
+        # Номер канала для каждого измерения
+        self.segment = np.repeat(np.arange(len(self.keys)), self.counts)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def load_batch(store, keys, since, until):
+    """Читает сырые измерения каналов за [since, until) из журнала (выполнять в отдельном потоке)"""
+    arrays = [
+        np.asarray(store.load_range(key, since, until), dtype=np.float64).reshape(-1, 2)
+        for key in keys
+    ]
+    return SeriesBatch(keys, arrays)
+
+
+def summarize(batch, since, until, sample_periods, thresholds):
+    """Считает показатели всех каналов пакета за период [since, until).
+
+    sample_periods - период опроса каждого канала, сек; thresholds - нижний порог для
+    градусо-часов (NaN - порог не задан). Среднее и градусо-часы взвешены по времени так же,
+    как скользящие окна: вес измерения - интервал до предыдущего, не больше MAX_GAP_PERIODS
+    периодов. Пропуск - интервал без измерений длиннее MAX_GAP_PERIODS периодов, включая
+    начало и конец периода. Возвращает словарь массивов длиной len(batch).
+    """
+    size = len(batch)
+    sample_periods = np.broadcast_to(np.asarray(sample_periods, dtype=np.float64), (size,))
+    thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.float64), (size,))
+    max_gap = sample_periods * MAX_GAP_PERIODS
+    span = until - since
+    counts = batch.counts
+    present = counts > 0
+    starts = batch.starts[present]
+    times, values, segment = batch.times, batch.values, batch.segment
+
+    result = {"count": counts}
+    for name in ("mean", "min", "max", "degree_hours"):
+        result[name] = np.full(size, np.nan)
+    result["percentiles"] = np.full((size, len(PERCENTILES)), np.nan)
+
+    # Веса измерений: интервал до предыдущего измерения того же канала
+    intervals = np.diff(times, prepend=times[:1])
+    is_first = np.zeros(len(times), dtype=bool)
+    is_first[starts] = True
+    weights = np.where(is_first, sample_periods[segment], np.clip(intervals, 1e-3, max_gap[segment]))
+
+    if len(times):
+        total_weight = np.add.reduceat(weights, starts)
+        result["mean"][present] = np.add.reduceat(weights * values, starts) / total_weight
+        result["min"][present] = np.minimum.reduceat(values, starts)
+        result["max"][present] = np.maximum.reduceat(values, starts)
+        deficit = np.clip(thresholds[segment] - values, 0.0, None) * weights
+        result["degree_hours"][present] = np.add.reduceat(deficit, starts) / 3600
+        result["percentiles"][present] = _segment_percentiles(
+            values, segment, starts, counts[present], result["min"], result["max"]
+        )
+    result["degree_hours"][np.isnan(thresholds)] = np.nan
+
+    # Пропуски: между соседними измерениями, от начала периода до первого и от последнего до конца
+    ends = starts + counts[present] - 1
+    channels = np.arange(size)[present]
+    gap_segment = np.concatenate((segment[~is_first], channels, channels))
+    gap_length = np.concatenate((intervals[~is_first], times[starts] - since, until - times[ends]))
+    is_gap = gap_length > max_gap[gap_segment]
+    gap_segment, gap_length = gap_segment[is_gap], gap_length[is_gap]
+    result["gap_count"] = np.bincount(gap_segment, minlength=size)
+    result["gap_total"] = np.bincount(gap_segment, weights=gap_length, minlength=size)
+    result["gap_longest"] = np.zeros(size)
+    np.maximum.at(result["gap_longest"], gap_segment, gap_length)
+    # Канал без единого измерения - один пропуск на весь период
+    result["gap_count"][~present] = 1
+    result["gap_total"][~present] = span
+    result["gap_longest"][~present] = span
+    result["coverage"] = np.clip(1.0 - result["gap_total"] / span, 0.0, 1.0)
+    return result
+
+
+def _segment_percentiles(values, segment, starts, counts, low, high):
+    """Процентили PERCENTILES каждого непустого сегмента (линейная интерполяция, как np.percentile).
+
+    Все сегменты сортируются одной сортировкой: значения сдвигаются так, чтобы диапазон
+    сегмента i лежал целиком выше диапазона сегмента i - 1, и после сортировки сдвиг вычитается.
+    """
+    width = np.nan_to_num(high - low) + 1.0
+    offsets = np.concatenate(([0.0], np.cumsum(width)[:-1])) - np.nan_to_num(low)
+    ordered = np.sort(values + offsets[segment]) - offsets[segment]
+    fractions = np.asarray(PERCENTILES, dtype=np.float64) / 100
+    positions = starts[:, None] + fractions[None, :] * (counts[:, None] - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (positions - lower)
+
+
+def correlate(batch, pairs):
+    """Коэффициент корреляции Пирсона для пар каналов (индексы в пакете) по общим моментам измерений.
+
+    Каналы одного устройства записываются с одной отметкой времени цикла опроса, поэтому пары
+    сопоставляются по точному совпадению времени. Возвращает (коэффициенты, число пар измерений);
+    коэффициент - NaN, если пар меньше MIN_CORRELATION_SAMPLES или один из каналов постоянен
+    (их различают по числу пар).
+    """
+    xs, ys = [], []
+    for first, second in pairs:
+        first_slice = slice(batch.starts[first], batch.starts[first] + batch.counts[first])
+        second_slice = slice(batch.starts[second], batch.starts[second] + batch.counts[second])
+        first_times, second_times = batch.times[first_slice], batch.times[second_slice]
+        # Время в сегменте упорядочено, поэтому совпадения ищутся бинарным поиском без сортировки;
+        # NaN в конце - заглушка для моментов позже последнего измерения второго канала
+        second_index = np.searchsorted(second_times, first_times)
+        matched = np.append(second_times, np.nan)[second_index] == first_times
+        xs.append(batch.values[first_slice][matched])
+        ys.append(batch.values[second_slice][second_index[matched]])
+
+    # Пары измерений всех пар каналов лежат подряд, как каналы в SeriesBatch
+    counts = np.array([len(x) for x in xs], dtype=np.int64)
+    coefficients = np.full(len(pairs), np.nan)
+    present = counts >= MIN_CORRELATION_SAMPLES
+    if not present.any():
+        return coefficients, counts
+    x = np.concatenate([x for x, enough in zip(xs, present) if enough])
+    y = np.concatenate([y for y, enough in zip(ys, present) if enough])
+    sizes = counts[present]
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    # Центрируем по средним пары, чтобы суммы квадратов не теряли точность
+    x = x - np.repeat(np.add.reduceat(x, starts) / sizes, sizes)
+    y = y - np.repeat(np.add.reduceat(y, starts) / sizes, sizes)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        coefficients[present] = np.add.reduceat(x * y, starts) / np.sqrt(
+            np.add.reduceat(x * x, starts) * np.add.reduceat(y * y, starts)
+        )
+    return coefficients, counts
+
+
+def format_duration(seconds):
+    """Длительность в виде "2 ч 05 мин" или "12 мин" """
+    minutes = int(round(seconds / 60))
+    if minutes < 60:
+        return f"{minutes} мин"
+    return f"{minutes // 60} ч {minutes % 60:02d} мин"
+
+
+def format_channel_summary(title, stats, position, threshold=None):
+    """Формирует блок сводки одного канала по результату summarize()"""
+    if not stats["count"][position]:
+        return f"🌡️ {title}\n⚠️ Нет данных за период"
+    percentiles = " / ".join(
+        f"P{rank} {value:.1f}" for rank, value in zip(PERCENTILES, stats["percentiles"][position])
+    )
+    text = (
+        f"🌡️ {title}\n"
+        f"📉 мин {stats['min'][position]:.1f} / сред {stats['mean'][position]:.1f} / "
+        f"макс {stats['max'][position]:.1f} °С\n"
+        f"📊 {percentiles} °С"
+    )
+    if threshold is not None:
+        text += f"\n❄️ Ниже {threshold:.1f} °С: {stats['degree_hours'][position]:.1f} °С·ч"
+    text += f"\n📡 Данные за {stats['coverage'][position] * 100:.0f}% времени"
+    if stats["gap_count"][position]:
+        text += (
+            f", пропусков {stats['gap_count'][position]}: всего {format_duration(stats['gap_total'][position])}, "
+            f"самый долгий {format_duration(stats['gap_longest'][position])}"
+        )
+    return text
+
+
+def format_channel_line(label, stats, position):
+    """Краткая строка сводки канала для большого парка"""
+    if not stats["count"][position]:
+        return f"⚠️ {label}: нет данных"
+    return (
+        f"🌡️ {label}: {stats['min'][position]:.1f} / {stats['mean'][position]:.1f} / "
+        f"{stats['max'][position]:.1f} °С, данные {stats['coverage'][position] * 100:.0f}%"
+    )
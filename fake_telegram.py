@@ -0,0 +1,248 @@
+"""Локальная замена Telegram Bot API для проверки бота без сети
+
+Отвечает на запросы бота (getMe, setWebhook, getUpdates, sendMessage, sendPhoto и другие),
+запоминает отправленные сообщения и доставляет обновления-команды на зарегистрированный
+вебхук, замеряя время до ответа бота.
+
+Запуск: python fake_telegram.py --port 8081 --requests 200 --concurrency 20 --latency 0.1
+и бот с TELEGRAM_API_URL=http://127.0.0.1:8081 TELEGRAM_WEBHOOK_URL=http://127.0.0.1:8443
+"""
+import argparse
+import asyncio
+import email.parser
+import email.policy
+import itertools
+import json
+import time
+from urllib.parse import parse_qsl
+
+import httpx
+from loguru import logger
+
+# Пользователь-бот, которого возвращает getMe
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake bot", "username": "fake_bot",
+            "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+# Сколько ждать ответа бота на команду, сек
+REPLY_TIMEOUT = 10.0
+
+
+class FakeTelegramAPI:
+    """HTTP-сервер на asyncio с методами Bot API; отправленные ботом сообщения копятся в sent"""
+
+    def __init__(self, host="127.0.0.1", port=8081, latency=0.0):
+        self.host = host
+        self.port = port
+        # Задержка ответа на отправку сообщений, как сетевая задержка до api.telegram.org, сек
+        self.latency = latency
+        self.sent = []
+        self.webhook_url = None
+        self.secret_token = None
+        self.webhook_set = asyncio.Event()
+        self._ids = itertools.count(1)
+        # Ожидающие ответа команды: chat_id -> future с текстом ответа
+        self._waiters = {}
+        self._connections = set()
+        self._server = None
+        self._client = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._client = httpx.AsyncClient(timeout=REPLY_TIMEOUT)
+        logger.info(f"🧪 Имитатор Telegram Bot API слушает http://{self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Открытые соединения бота сервер сам не закрывает
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _handle(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            # Соединение держится открытым для следующих запросов, как у api.telegram.org
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                path = request_line.decode("latin-1").split()[1]
+                method = path.rstrip("/").rsplit("/", 1)[-1]
+                params = _parse_body(headers.get("content-type", ""), body)
+                result = await self._call(method, params)
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(
+                    f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError) as error:
+            logger.debug(f"Имитатор Telegram: соединение прервано: {error}")
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _call(self, method, params):
+        if method == "getMe":
+            return BOT_USER
+        if method == "setWebhook":
+            self.webhook_url = params.get("url")
+            self.secret_token = params.get("secret_token")
+            self.webhook_set.set()
+            logger.info(f"🌐 Зарегистрирован вебхук {self.webhook_url}")
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            self.webhook_set.clear()
+            return True
+        if method == "getWebhookInfo":
+            return {"url": self.webhook_url or "", "has_custom_certificate": False, "pending_update_count": 0}
+        if method == "getUpdates":
+            # Обновления доставляются только через вебхук: long polling просто ждет свой таймаут
+            await asyncio.sleep(min(float(params.get("timeout") or 0), 1.0))
+            return []
+        if not method.startswith("send"):
+            return True
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent.append((method, params))
+        chat_id = params.get("chat_id")
+        waiter = self._waiters.pop(str(chat_id), None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(params.get("text") or params.get("caption") or "")
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": _chat_id(chat_id), "type": "private"},
+            "text": params.get("text"),
+        }
+
+    async def deliver(self, update):
+        """Отправляет обновление на вебхук бота с секретом из setWebhook; возвращает код ответа"""
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.secret_token} if self.secret_token else {}
+        response = await self._client.post(self.webhook_url, json=update, headers=headers)
+        return response.status_code
+
+    async def command(self, text, chat_id, timeout=REPLY_TIMEOUT):
+        """Присылает боту команду от чата chat_id и ждет ответное сообщение в тот же чат.
+
+        Возвращает (текст ответа, время от отправки обновления до ответа, сек).
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[str(chat_id)] = waiter
+        started = time.perf_counter()
+        try:
+            await self.deliver(command_update(next(self._ids), chat_id, text))
+            reply = await asyncio.wait_for(waiter, timeout)
+        finally:
+            self._waiters.pop(str(chat_id), None)
+        return reply, time.perf_counter() - started
+
+
+def command_update(update_id, chat_id, text):
+    """Обновление Bot API с командой text в личном чате chat_id"""
+    command = text.split()[0]
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "Test"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }
+
+
+def _chat_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _parse_body(content_type, body):
+    """Параметры запроса бота: form-urlencoded, multipart/form-data (файлы) или JSON"""
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("multipart/form-data"):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        return {
+            part.get_param("name", header="content-disposition"): part.get_content()
+            for part in message.iter_parts() if part.get_filename() is None
+        }
+    return dict(parse_qsl(body.decode()))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _run(args):
+    api = FakeTelegramAPI(args.host, args.port, args.latency)
+    await api.start()
+    try:
+        if not args.requests:
+            await asyncio.Event().wait()
+        logger.info("⏳ Ожидание регистрации вебхука ботом...")
+        await api.webhook_set.wait()
+        # У каждой команды свой чат, чтобы ответы не путались с рассылками и друг с другом
+        chat_ids = itertools.count(10_000)
+        limit = asyncio.Semaphore(args.concurrency)
+
+        async def one():
+            async with limit:
+                return await api.command(args.command, next(chat_ids))
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(args.requests)), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        latencies = [result[1] for result in results if not isinstance(result, BaseException)]
+        failed = len(results) - len(latencies)
+        if latencies:
+            print(
+                f"{args.command}: {len(latencies)} ответов за {elapsed:.2f} с, ошибок {failed}; "
+                f"p50 {percentile(latencies, 0.5) * 1000:.1f} мс, p99 {percentile(latencies, 0.99) * 1000:.1f} мс"
+            )
+        else:
+            print(f"{args.command}: нет ответов, ошибок {failed}")
+    finally:
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Имитатор Telegram Bot API для проверки режима вебхука")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--requests", type=int, default=0, help="сколько команд отправить (0 - только сервер)")
+    parser.add_argument("--concurrency", type=int, default=10, help="команд одновременно")
+    parser.add_argument("--command", default="/temperature")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа на отправку сообщений, сек")
+    try:
+        asyncio.run(_run(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Парк контроллеров: конфигурация, состояние устройств и планировщик опроса"""
+import asyncio
+from dataclasses import dataclass, field
+import random
+import time
+import tomllib
+
+from colorama import Fore
+from loguru import logger
+
+from alert_rules import AlertEngine, parse_rule
+from metrics import MODBUS_CYCLE_SECONDS, MODBUS_MISSED_CYCLES, MODBUS_READ_ERRORS
+from modbus_connection import ModbusConnectionManager, STATE_CONNECTED
+from poller import ModbusPoller
+from register_map import REGISTER_MAP, RegisterChannel
+from rolling_stats import ChannelHistory
+from snapshot import SnapshotPublisher, snapshot_device
+
+# Значения по умолчанию для устройств из файла конфигурации
+DEFAULT_POLL_INTERVAL = 10
+DEFAULT_TIMEOUT = 3
+# Сколько запросов одновременно может выполняться через один шлюз (по одному соединению на запрос)
+DEFAULT_MAX_IN_FLIGHT = 1
+
+
+@dataclass
+class DeviceConfig:
+    """Описание одного контроллера парка"""
+    name: str
+    title: str
+    host: str
+    port: int
+    unit_id: int
+    poll_interval: float = DEFAULT_POLL_INTERVAL
+    timeout: float = DEFAULT_TIMEOUT
+    channels: list = field(default_factory=lambda: list(REGISTER_MAP))
+    # Правила оповещения; None - правила по умолчанию приложения
+    alerts: list = None
+
+    @property
+    def gateway_key(self):
+        return self.host, self.port
+
+
+class Device:
+    """Состояние одного контроллера: история каналов, состояние предупреждений, результат опроса"""
+
+    def __init__(self, config, windows, sample_period=None):
+        self.config = config
+        self.name = config.name
+        self.title = config.title
+        self.poller = ModbusPoller(config.channels, config.unit_id, config.name)
+        self.histories = {
+            channel.name: ChannelHistory(windows, sample_period or config.poll_interval)
+            for channel in config.channels
+        }
+        # Правила оповещения устройства и их состояние
+        self.alerts = AlertEngine(config.alerts or [], {channel.name for channel in config.channels})
+        self.last_success = None
+        self.consecutive_failures = 0
+        self.last_error = None
+        # Пропущенные сроки опроса (цикл не уложился в период) и длительность последнего цикла, сек
+        self.missed_cycles = 0
+        self.last_cycle_duration = None
+
+    @property
+    def channels(self):
+        return self.config.channels
+
+    @property
+    def poll_interval(self):
+        return self.config.poll_interval
+
+    def key(self, channel_name):
+        """Ключ канала в журнале измерений"""
+        return f"{self.name}/{channel_name}"
+
+
+class Gateway:
+    """Шлюз Modbus TCP: пул соединений ограничивает число одновременных запросов.
+
+    timeout - таймаут подключения; ответа на запрос каждое устройство ждет по своему таймауту.
+    """
+
+    def __init__(self, host, port, max_in_flight=DEFAULT_MAX_IN_FLIGHT, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.connections = [ModbusConnectionManager(host, port, timeout=timeout) for _ in range(max_in_flight)]
+        self._free = asyncio.Queue()
+        for connection in self.connections:
+            self._free.put_nowait(connection)
+
+    async def acquire(self):
+        return await self._free.get()
+
+    def release(self, connection):
+        self._free.put_nowait(connection)
+
+    def status(self):
+        """Состояние самого живого соединения шлюза"""
+        statuses = [connection.status() for connection in self.connections]
+        connected = [status for status in statuses if status["state"] == STATE_CONNECTED]
+        return connected[0] if connected else statuses[0]
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+
+class FleetScheduler:
+    """Опрашивает все устройства парка параллельно, каждое со своим периодом.
+
+    Медленные и недоступные устройства не задерживают остальные: опрос каждого
+    устройства ограничен таймаутом, а шлюз выдает не больше max_in_flight
+    соединений одновременно. Циклы запускаются по сеткам сроков на монотонных часах,
+    поэтому длительность опроса не сдвигает период; просроченные сроки пропускаются
+    и учитываются в missed_cycles, а не выполняются пачкой. После каждого цикла
+    публикуется новый снимок состояния (snapshots.current).
+    """
+
+    def __init__(self, devices, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.devices = {device.name: device for device in devices}
+        self.on_sample = None
+        self.gateways = {}
+        for device in devices:
+            key = device.config.gateway_key
+            if key not in self.gateways:
+                # Подключение к шлюзу ждем по самому большому таймауту его устройств
+                timeout = max(other.config.timeout for other in devices if other.config.gateway_key == key)
+                self.gateways[key] = Gateway(device.config.host, device.config.port, max_in_flight, timeout)
+        self._tasks = []
+        self.snapshots = SnapshotPublisher()
+
+    def gateway(self, device):
+        return self.gateways[device.config.gateway_key]
+
+    def publish(self, device):
+        """Публикует снимок устройства с текущей историей и состоянием связи"""
+        return self.snapshots.publish(snapshot_device(device, self.gateway(device).status()))
+
+    def start(self, on_sample):
+        """Запускает по задаче на устройство; on_sample(device, values, timestamp) получает измерения"""
+        self.on_sample = on_sample
+        # Начальный снимок: история могла быть восстановлена из журнала до запуска опроса
+        for device in self.devices.values():
+            self.publish(device)
+        self._tasks = [
+            asyncio.create_task(self._run_device(device), name=f"poll_{device.name}")
+            for device in self.devices.values()
+        ]
+        logger.info(f"🔄 Опрос парка запущен: устройств {len(self.devices)}, шлюзов {len(self.gateways)}")
+
+    async def stop(self):
+        """Останавливает опрос и закрывает соединения"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for gateway in self.gateways.values():
+            gateway.close()
+        print(Fore.GREEN + "Соединение закрыто")
+        logger.info("🔌 Modbus: соединения закрыты")
+
+    async def _run_device(self, device):
+        interval = device.config.poll_interval
+        cycle_seconds = MODBUS_CYCLE_SECONDS.labels(device.name)
+        missed_cycles = MODBUS_MISSED_CYCLES.labels(device.name)
+        deadline = time.monotonic()
+        # Случайный сдвиг старта, чтобы сотни устройств не опрашивались в одну и ту же секунду
+        if len(self.devices) > 1:
+            deadline += random.uniform(0, interval)
+        while True:
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started = time.monotonic()
+            await self.poll_device(device)
+            self.publish(device)
+            device.last_cycle_duration = time.monotonic() - started
+            cycle_seconds.observe(device.last_cycle_duration)
+
+            deadline += interval
+            late = time.monotonic() - deadline
+            if late >= 0:
+                # Цикл не уложился в период: пропускаем просроченные сроки и ждем следующего по сетке
+                missed = int(late // interval) + 1
+                device.missed_cycles += missed
+                missed_cycles.inc(missed)
+                deadline += missed * interval
+                logger.warning(f"⚠️ [{device.name}] Цикл опроса занял {device.last_cycle_duration:.1f} сек, "
+                               f"пропущено сроков: {missed}")
+
+    async def poll_device(self, device):
+        """Выполняет один цикл опроса устройства и передает значения в on_sample"""
+        gateway = self.gateway(device)
+        # Таймаут на весь цикл: соединение + все блоки чтения; столько же можно ждать свободное соединение
+        deadline = device.config.timeout * (len(device.poller.blocks) + 1)
+        try:
+            connection = await asyncio.wait_for(gateway.acquire(), timeout=deadline)
+        except asyncio.TimeoutError:
+            device.consecutive_failures += 1
+            device.last_error = "все соединения шлюза заняты"
+            MODBUS_READ_ERRORS.labels(device.name, "busy").inc()
+            logger.error(f"❌ Modbus [{device.name}]: все соединения шлюза заняты дольше {deadline:g} сек")
+            return
+        try:
+            values = await asyncio.wait_for(device.poller.poll(connection, device.config.timeout), timeout=deadline)
+        except asyncio.TimeoutError:
+            values = None
+            # Цикл прерван во время подключения - это сбой шлюза; молчание устройства сокет не закрывает
+            if connection.state != STATE_CONNECTED:
+                connection.mark_failed("превышено время подключения")
+            device.last_error = "превышено время ожидания ответа"
+            MODBUS_READ_ERRORS.labels(device.name, "timeout").inc()
+            logger.error(f"❌ Modbus [{device.name}]: превышено время ожидания ответа ({deadline:g} сек)")
+        except Exception as modbus_error:
+            # Ошибки транспорта соединение обрабатывает само (закрывает сокет и откладывает переподключение)
+            values = None
+            device.last_error = str(modbus_error)
+            MODBUS_READ_ERRORS.labels(device.name, "exception").inc()
+            print(Fore.RED + f"[{device.name}] Ошибка при чтении: {modbus_error}")
+            logger.error(f"❌ Modbus [{device.name}]: ошибка при чтении: {modbus_error}")
+        finally:
+            gateway.release(connection)
+
+        # Время измерения - момент получения ответа, а не плановый срок цикла
+        timestamp = time.time()
+        if not values:
+            device.consecutive_failures += 1
+            return
+        device.consecutive_failures = 0
+        device.last_success = timestamp
+        try:
+            await self.on_sample(device, values, device.last_success)
+        except Exception as sample_error:
+            logger.error(f"❌ [{device.name}] Ошибка обработки измерений: {sample_error}")
+
+
+def _parse_channel(raw):
+    return RegisterChannel(
+        name=raw["name"],
+        title=raw.get("title", raw["name"]),
+        address=int(raw["address"]),
+        data_type=raw.get("data_type", "float32"),
+        word_order=raw.get("word_order", "big"),
+        scale=float(raw.get("scale", 1.0)),
+        offset=float(raw.get("offset", 0.0)),
+    )
+
+
+def load_fleet_config(path):
+    """Читает TOML-файл парка; возвращает (список DeviceConfig, max_in_flight)"""
+    with open(path, "rb") as config_file:
+        raw = tomllib.load(config_file)
+
+    defaults = raw.get("defaults", {})
+    configs = []
+    for raw_device in raw.get("devices", []):
+        settings = dict(defaults, **raw_device)
+        channels = [_parse_channel(channel) for channel in settings.get("channels", [])] or list(REGISTER_MAP)
+        alerts = [parse_rule(rule) for rule in settings["alerts"]] if "alerts" in settings else None
+        configs.append(DeviceConfig(
+            name=settings["name"],
+            title=settings.get("title", settings["name"]),
+            host=settings["host"],
+            port=int(settings.get("port", 502)),
+            unit_id=int(settings.get("unit_id", 1)),
+            poll_interval=float(settings.get("poll_interval", DEFAULT_POLL_INTERVAL)),
+            timeout=float(settings.get("timeout", DEFAULT_TIMEOUT)),
+            channels=channels,
+            alerts=alerts,
+        ))
+
+    names = [config.name for config in configs]
+    if len(names) != len(set(names)):
+        raise ValueError("Имена устройств в конфигурации парка должны быть уникальными")
+    if not configs:
+        raise ValueError(f"В файле {path} не описано ни одного устройства")
+    return configs, int(defaults.get("max_in_flight_per_gateway", DEFAULT_MAX_IN_FLIGHT))
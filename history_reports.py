@@ -0,0 +1,148 @@
+"""История и графики температуры по агрегатам из журнала измерений"""
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone
+import io
+import time
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.dates import DateFormatter
+
+from sample_store import TIERS
+
+# Периоды: название -> (длительность, уровень агрегатов, интервал строки /history), сек
+HISTORY_PERIODS = {
+    "1h": (60 * 60, "1m", 10 * 60),
+    "6h": (6 * 60 * 60, "1m", 60 * 60),
+    "24h": (24 * 60 * 60, "1h", 3 * 60 * 60),
+    "7d": (7 * 24 * 60 * 60, "1h", 24 * 60 * 60),
+    "30d": (30 * 24 * 60 * 60, "1h", 24 * 60 * 60),
+}
+
+# Сколько графиков держать в кэше
+CHART_CACHE_SIZE = 32
+
+
+def merge_buckets(rows, size):
+    """Сворачивает агрегаты (bucket, count, sum, min, max) в интервалы длиной size.
+
+    Возвращает список (начало интервала, количество, среднее, минимум, максимум).
+    """
+    merged = []
+    for bucket, count, total, low, high in rows:
+        start = bucket // size * size
+        if merged and merged[-1][0] == start:
+            _, prev_count, prev_total, prev_low, prev_high = merged[-1]
+            merged[-1] = (start, prev_count + count, prev_total + total, min(prev_low, low), max(prev_high, high))
+        else:
+            merged.append((start, count, total, low, high))
+    return [(start, count, total / count, low, high) for start, count, total, low, high in merged]
+
+
+def format_history(store, series, period, now=None):
+    """Формирует текст /history: минимум, среднее и максимум по интервалам периода.
+
+    series - список пар (ключ канала в журнале, подпись).
+    """
+    duration, tier, row_size = HISTORY_PERIODS[period]
+    now = time.time() if now is None else now
+    message = f"📜 История температуры за {period}\n"
+    for key, title in series:
+        rows = merge_buckets(store.query_buckets(key, tier, now - duration, now), row_size)
+        message += f"\n🌡️ {title}\n"
+        if not rows:
+            message += "⚠️ Нет данных за период\n"
+            continue
+        time_format = "%H:%M" if row_size < 24 * 60 * 60 else "%d.%m"
+        for start, _count, mean, low, high in rows:
+            label = datetime.fromtimestamp(start, timezone.utc).strftime(time_format)
+            message += f"{label}  мин {low:.1f} / сред {mean:.1f} / макс {high:.1f} °С\n"
+    return message.rstrip("\n") + "\n\n🕐 Время указано в UTC"
+
+
+def render_chart(title, period, rows):
+    """Рисует PNG-график: среднее по интервалам и коридор минимум-максимум"""
+    times = [datetime.fromtimestamp(row[0], timezone.utc) for row in rows]
+    means = [row[2] / row[1] for row in rows]
+    lows = [row[3] for row in rows]
+    highs = [row[4] for row in rows]
+
+    figure = Figure(figsize=(8, 4), dpi=100)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.fill_between(times, lows, highs, alpha=0.25, linewidth=0)
+    axes.plot(times, means, linewidth=1.5)
+    axes.set_title(f"{title}, {period}")
+    axes.set_ylabel("°С")
+    axes.xaxis.set_major_formatter(DateFormatter("%H:%M" if HISTORY_PERIODS[period][0] <= 24 * 60 * 60 else "%d.%m"))
+    axes.grid(True, alpha=0.3)
+    figure.autofmt_xdate()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+class ChartCache:
+    """Кэш готовых PNG по ключу (канал, период, граница последнего интервала) с вытеснением LRU"""
+
+    def __init__(self, max_size=CHART_CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        # Графики, которые рисуются прямо сейчас: ключ -> задача
+        self.rendering = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(channel_key, period, now):
+        tier = HISTORY_PERIODS[period][1]
+        return channel_key, period, int(now // TIERS[tier] * TIERS[tier])
+
+    def get(self, key):
+        image = self._items.get(key)
+        if image is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return image
+
+    def put(self, key, image):
+        self._items[key] = image
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+def _build_chart(store, channel_key, title, period, now):
+    """Читает агрегаты и рисует график (выполняется в отдельном потоке)"""
+    duration, tier, _ = HISTORY_PERIODS[period]
+    rows = store.query_buckets(channel_key, tier, now - duration, now)
+    return render_chart(title, period, rows) if rows else None
+
+
+async def get_chart(store, cache, channel_key, title, period, now=None):
+    """Возвращает PNG-график из кэша или строит его по агрегатам; None, если данных нет.
+
+    Одновременные запросы одного графика ждут одну и ту же отрисовку.
+    """
+    now = time.time() if now is None else now
+    key = cache.key(channel_key, period, now)
+    image = cache.get(key)
+    if image is not None:
+        return image
+
+    task = cache.rendering.get(key)
+    if task is None:
+        task = asyncio.ensure_future(asyncio.to_thread(_build_chart, store, channel_key, title, period, now))
+        cache.rendering[key] = task
+        try:
+            image = await asyncio.shield(task)
+        finally:
+            del cache.rendering[key]
+        if image is not None:
+            cache.put(key, image)
+        return image
+    return await asyncio.shield(task)
@@ -1,15 +1,24 @@
 from colorama import init, Fore
-from pymodbus.client import ModbusTcpClient
 from datetime import datetime, time as dtime, timezone
-import struct
-import time
 import os
 from dotenv import load_dotenv
 from telegram.ext import ApplicationBuilder, CallbackContext, CommandHandler
 from loguru import logger
-import threading
-from collections import deque
+from fleet import Device, DeviceConfig, FleetScheduler, load_fleet_config
+from alert_rules import RULE_TYPES, StaleRule, ThresholdRule
+from sample_store import SampleStore
+from telegram_outbox import TelegramOutbox
+from subscriptions import SubscriberRegistry
+from snapshot import ReportCache
+from metrics import COMMAND_SECONDS, MetricsServer
+from history_reports import HISTORY_PERIODS, ChartCache, format_history, get_chart
+from daily_analytics import MIN_CORRELATION_SAMPLES, SUMMARY_PERIODS, correlate, format_channel_line, format_channel_summary, format_duration, load_batch, summarize
+import numpy as np
 import asyncio
+import functools
+import math
+import secrets
+import time
 
 init()
 
@@ -22,338 +31,551 @@ TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 os.makedirs("logs", exist_ok=True)
 logger.add("logs/bot.log", rotation="1 day", retention="7 days", level="INFO")
 
+# Каталог для базы измерений (в Docker монтируется как том, чтобы история переживала перезапуск)
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+os.makedirs(DATA_DIR, exist_ok=True)
+
+# Адрес эндпоинта метрик Prometheus (пустой METRICS_PORT отключает его)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = os.getenv('METRICS_PORT', '9108')
+
+# Режим вебхука: при заданном TELEGRAM_WEBHOOK_URL (внешний адрес бота) обновления приходят
+# на локальный HTTP-сервер WEBHOOK_LISTEN:WEBHOOK_PORT вместо long polling
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+# Секрет - путь вебхука и заголовок X-Telegram-Bot-Api-Secret-Token (без него создается при каждом запуске)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+# Сколько обновлений обрабатывается одновременно (и сколько соединений вебхука открывает Telegram)
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '16'))
+# Адрес Bot API, например http://127.0.0.1:8081 для имитатора fake_telegram.py
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
 # Функция для отправки сообщения в Telegram (используется при запуске)
-async def send_startup_notification(app):
-    """Отправляет уведомление о запуске бота"""
+async def send_startup_notification(_context: CallbackContext) -> None:
+    """Ставит в очередь уведомление о запуске бота"""
     if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
         try:
-            await app.bot.send_message(
-                chat_id=TELEGRAM_CHAT_ID,
-                text=                     "🚀 main.py запущен\n\n"
-                     "✅ Modbus опрос активен (каждые 10 сек)\n"
-                     "📊 Отслеживаемые параметры:\n"
-                     "   • Температура подачи СО (регистр 5)\n"
-                     "   • Температура воздуха в котельной (регистр 7)\n"
-                     "📊 Расчет средней температуры за час (360 измерений)\n"
+            outbox.send(
+                TELEGRAM_CHAT_ID,
+                "🚀 main.py запущен\n\n"
+                     f"✅ Modbus опрос активен (каждые {POLL_INTERVAL} сек)\n"
+                     f"{describe_devices()}"
+                     f"📊 Расчет средней температуры за час ({TEMP_HISTORY_SIZE} измерений)\n"
                      f"⚠️ Мониторинг низкой температуры подачи СО (порог: {MIN_AVERAGE_TEMPERATURE:.1f} °С)\n"
+                     f"🔔 Правил оповещения: {sum(len(device.alerts.rules) for device in fleet.devices.values())}\n"
                      "⏰ Ежедневные отчеты: 01:00 UTC и 14:00 UTC\n\n"
                      "💡 Доступные команды:\n"
-                     "   /temperature - показать текущую температуру"
+                     "   /temperature - показать текущую температуру\n"
+                     f"   /history <период> - история температуры ({', '.join(HISTORY_PERIODS)})\n"
+                     "   /chart <канал> <период> - график температуры\n"
+                     f"   /summary <период> - сводка: процентили, градусо-часы, пропуски ({', '.join(SUMMARY_PERIODS)})\n"
+                     "   /subscribe [каналы] [типы оповещений] - подписаться на отчеты и оповещения\n"
+                     "   /unsubscribe - отписаться"
             )
-            logger.info("✅ Уведомление о запуске отправлено в Telegram")
+            logger.info("✅ Уведомление о запуске поставлено в очередь Telegram")
         except Exception as telegram_error:
             logger.error(f"❌ Ошибка отправки уведомления: {telegram_error}")
             print(Fore.RED + f"Ошибка отправки сообщения в Telegram: {telegram_error}")
     else:
         logger.warning("⚠️ Telegram бот не настроен (отсутствуют TELEGRAM_BOT_TOKEN или TELEGRAM_CHAT_ID)")
 
-# Функция для проверки и отправки предупреждения о низкой температуре
-async def check_and_send_low_temp_warning(bot_app, avg_temp, history_count):
-    """Проверяет среднюю температуру и отправляет предупреждение, если она ниже минимальной"""
-    global low_temp_warning_sent
+# Отправка оповещения о срабатывании правила или возврате к норме
+def send_alert(event):
+    """Формирует сообщение о смене состояния правила и ставит его в очередь отправки"""
+    device = event.device
+    rule = event.rule
+    title = rule.title or rule.name
+    current_time = datetime.fromtimestamp(event.timestamp).strftime("%d.%m.%Y %H:%M:%S")
+    channel_title = next((channel.title for channel in device.channels if channel.name == event.channel), event.channel)
     
-    if not TELEGRAM_CHAT_ID:
-        return
-    
-    # Проверяем условия: достаточно измерений и температура ниже минимальной
-    if history_count >= TEMP_HISTORY_SIZE and avg_temp < MIN_AVERAGE_TEMPERATURE:
-        # Отправляем предупреждение только если оно еще не было отправлено
-        if not low_temp_warning_sent:
-            try:
-                current_time = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-                message = (
-                    f"⚠️ ПРЕДУПРЕЖДЕНИЕ О НИЗКОЙ ТЕМПЕРАТУРЕ ⚠️\n\n"
-                    f"🕐 Время: {current_time}\n"
-                    f"🌡️ Средняя температура за час: {avg_temp:.1f} °С\n"
-                    f"📉 Минимальная допустимая: {MIN_AVERAGE_TEMPERATURE:.1f} °С\n"
-                    f"📊 Количество измерений: {history_count}/{TEMP_HISTORY_SIZE}\n\n"
-                    f"❄️ Средняя температура опустилась ниже {MIN_AVERAGE_TEMPERATURE:.1f} °С!"
-                )
-                
-                await bot_app.bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message)
-                low_temp_warning_sent = True
-                logger.warning(f"⚠️ Отправлено предупреждение о низкой температуре: {avg_temp:.1f} °С")
-                print(Fore.YELLOW + f"⚠️ Отправлено предупреждение о низкой температуре: {avg_temp:.1f} °С" + Fore.RESET)
-            except Exception as error:
-                logger.error(f"❌ Ошибка отправки предупреждения о низкой температуре: {error}")
+    if event.active:
+        message = (
+            f"⚠️ {title} ⚠️\n\n"
+            f"{device_label(device)}"
+            f"🕐 Время: {current_time}\n"
+            f"🌡️ {channel_title}\n"
+            f"{event.details()}"
+        )
+        logger.warning(f"⚠️ [{device.name}] Сработало правило {rule.name}: {event.details()}")
+        print(Fore.YELLOW + f"⚠️ [{device.name}] {title}: {event.value:.1f}" + Fore.RESET)
+    else:
+        message = (
+            f"✅ {title}: возврат к норме\n\n"
+            f"{device_label(device)}"
+            f"🕐 Время: {current_time}\n"
+            f"🌡️ {channel_title}\n"
+            f"{event.details()}"
+        )
+        logger.info(f"✅ [{device.name}] Правило {rule.name} вернулось к норме: {event.details()}")
+        print(Fore.GREEN + f"✅ [{device.name}] {title}: возврат к норме" + Fore.RESET)
     
-    # Сбрасываем флаг, если температура поднялась до порога сброса
-    elif avg_temp >= TEMP_RESET_THRESHOLD and low_temp_warning_sent:
-        low_temp_warning_sent = False
-        logger.info(f"✅ Температура вернулась к норме: {avg_temp:.1f} °С (порог сброса: {TEMP_RESET_THRESHOLD:.1f} °С)")
-        print(Fore.GREEN + f"✅ Температура вернулась к норме: {avg_temp:.1f} °С" + Fore.RESET)
+    # Сообщение формируется один раз для всех подписчиков; отправка не блокирует опрос.
+    # Срабатывание и возврат к норме - разные ключи: возврат не должен заменить неотправленное
+    # оповещение, а вместе с ним отбрасывается (подписчики не увидят ни того, ни другого)
+    key = f"{rule.name}/{device.name}"
+    state, opposite = ("active", "clear") if event.active else ("clear", "active")
+    outbox.broadcast(subscribers.alert_recipients(event), message,
+                     coalesce_key=f"{key}/{state}", cancel_key=f"{key}/{opposite}")
 
 print(Fore.GREEN + "Инициализация... начинаем опрос Z037..." + Fore.RESET)
 
-# Параметры подключения
+# Параметры подключения (режим одного контроллера)
 MODBUS_HOST = "5.128.70.180"
 MODBUS_PORT = 8502
 UNIT_ID = 247
-REGISTER_ADDRESS_Tpod_SO = 5 # адрес регистра Температура подачи системы отопления
-REGISTER_ADDRESS_Tvozd_kotel = 7 # адрес регистра Температура воздуха в котельной
+# Файл конфигурации парка контроллеров (если задан, параметры выше не используются)
+FLEET_CONFIG = os.getenv('FLEET_CONFIG')
 
-# Константа для хранения истории температур (360 * 10 сек = 1 час)
-TEMP_HISTORY_SIZE = 360
+# Период опроса контроллера, сек
+POLL_INTERVAL = 10
+# Окна скользящей статистики: 5 минут, 1 час, сутки (одна копия измерений на канал)
+HISTORY_WINDOWS = {"5m": 5 * 60, "1h": 60 * 60, "24h": 24 * 60 * 60}
+# Ожидаемое количество измерений за час (360 * 10 сек = 1 час, циклы идут по сетке сроков без дрейфа)
+TEMP_HISTORY_SIZE = HISTORY_WINDOWS["1h"] // POLL_INTERVAL
+# Какая доля часа должна быть покрыта измерениями, чтобы средней можно было доверять
+MIN_WINDOW_COVERAGE = 0.9
 # Минимальная допустимая средняя температура
 MIN_AVERAGE_TEMPERATURE = 25.0
 # Температура для сброса предупреждения о низкой температуре
 TEMP_RESET_THRESHOLD = 30.0
+# Канал, по которому отслеживается низкая температура
+LOW_TEMP_CHANNEL = "tpod_so"
+# Минимальная температура воздуха в котельной (средняя за 5 минут) и порог сброса предупреждения
+AIR_TEMP_CHANNEL = "tvozd_kotel"
+MIN_AIR_TEMPERATURE = 5.0
+AIR_TEMP_RESET_THRESHOLD = 8.0
+# Через сколько секунд без данных от контроллера отправлять предупреждение
+NO_DATA_TIMEOUT = 10 * 60
+# Значения в отчете помечаются как устаревшие, если последнее измерение старше стольких периодов опроса
+STALE_PERIODS = 2
+# При большем числе устройств /temperature без аргумента показывает краткую сводку
+FULL_REPORT_MAX_DEVICES = 5
+
+# Журнал измерений на диске: история восстанавливается из него при запуске
+sample_store = SampleStore(os.path.join(DATA_DIR, "samples.db"))
+# Как часто сбрасывать накопленные измерения на диск, сек
+STORE_FLUSH_INTERVAL = 60
+# Время ежедневных отчетов (UTC)
+DAILY_REPORT_TIMES = (dtime(hour=1, minute=0, tzinfo=timezone.utc), dtime(hour=14, minute=0, tzinfo=timezone.utc))
+# Кэш готовых графиков для /chart
+chart_cache = ChartCache()
+# Готовые тексты отчетов для текущей версии снимка парка
+report_cache = ReportCache()
+# Очередь исходящих сообщений: предупреждения и отчеты не ждут ответа Telegram
+outbox = TelegramOutbox()
+# Подписчики на отчеты и оповещения (чат TELEGRAM_CHAT_ID получает все сообщения)
+subscribers = SubscriberRegistry(os.path.join(DATA_DIR, "subscribers.json"), TELEGRAM_CHAT_ID)
+# HTTP-эндпоинт /metrics
+metrics_server = MetricsServer(METRICS_HOST, int(METRICS_PORT)) if METRICS_PORT else None
+
+# Правила оповещения по умолчанию (для устройств без секции alerts в файле парка)
+def default_alert_rules(channel_names):
+    """Возвращает правила по умолчанию, для которых у устройства есть каналы"""
+    rules = [
+        ThresholdRule("low_temp", LOW_TEMP_CHANNEL, window="1h", below=MIN_AVERAGE_TEMPERATURE,
+                      reset=TEMP_RESET_THRESHOLD, min_coverage=MIN_WINDOW_COVERAGE,
+                      title="ПРЕДУПРЕЖДЕНИЕ О НИЗКОЙ ТЕМПЕРАТУРЕ"),
+        ThresholdRule("low_air_temp", AIR_TEMP_CHANNEL, window="5m", below=MIN_AIR_TEMPERATURE,
+                      reset=AIR_TEMP_RESET_THRESHOLD, title="НИЗКАЯ ТЕМПЕРАТУРА В КОТЕЛЬНОЙ"),
+        StaleRule("no_data", LOW_TEMP_CHANNEL, max_age=NO_DATA_TIMEOUT, title="НЕТ ДАННЫХ ОТ КОНТРОЛЛЕРА"),
+    ]
+    return [rule for rule in rules if set(rule.channels) <= channel_names]
+
+# Создание устройств: из файла парка или одно устройство Z037 по параметрам выше
+def build_fleet():
+    """Создает устройства (каждое со своей историей и состоянием предупреждений) и планировщик опроса"""
+    if FLEET_CONFIG:
+        configs, max_in_flight = load_fleet_config(FLEET_CONFIG)
+        logger.info(f"🏭 Загружена конфигурация парка {FLEET_CONFIG}: устройств {len(configs)}")
+    else:
+        configs = [DeviceConfig(name="z037", title="Z037", host=MODBUS_HOST, port=MODBUS_PORT,
+                                unit_id=UNIT_ID, poll_interval=POLL_INTERVAL)]
+        max_in_flight = 1
+    for config in configs:
+        if config.alerts is None:
+            config.alerts = default_alert_rules({channel.name for channel in config.channels})
+    # Опрос и обработчики команд работают в одном цикле событий, поэтому блокировки не нужны
+    return FleetScheduler([Device(config, HISTORY_WINDOWS) for config in configs], max_in_flight)
+
+fleet = build_fleet()
+
+# Вспомогательные функции для подписей устройств
+def expected_samples(device, window="1h"):
+    """Ожидаемое количество измерений устройства в окне (360 * 10 сек = 1 час)"""
+    return int(HISTORY_WINDOWS[window] // device.poll_interval)
 
-# Глобальные переменные для хранения температуры подачи СО
-last_temperature = None
-# Массив для хранения последних значений температуры (360 * 10 сек = 1 час)
-temperature_history = deque(maxlen=TEMP_HISTORY_SIZE)
-temperature_lock = threading.Lock()
-# Флаг для отслеживания отправки предупреждения о низкой температуре
-low_temp_warning_sent = False
-
-# Глобальные переменные для хранения температуры воздуха в котельной
-last_temperature_air = None
-# Массив для хранения последних значений температуры воздуха (360 * 10 сек = 1 час)
-temperature_air_history = deque(maxlen=TEMP_HISTORY_SIZE)
-temperature_air_lock = threading.Lock()
-
-# Функция для опроса Modbus (работает в отдельном потоке)
-def modbus_polling_loop(bot_app=None):
-    """Постоянно опрашивает Modbus и обновляет температуру"""
-    global last_temperature, temperature_history, last_temperature_air, temperature_air_history
+def device_label(device):
+    """Строка с названием устройства для сообщений (только в режиме парка)"""
+    return f"🏭 Объект: {device.title}\n" if len(fleet.devices) > 1 else ""
+
+def describe_devices():
+    """Описание отслеживаемых параметров для уведомления о запуске"""
+    if len(fleet.devices) > 1:
+        return f"🏭 Устройств в парке: {len(fleet.devices)}\n"
+    device = next(iter(fleet.devices.values()))
+    lines = "".join(f"   • {channel.title} (регистр {channel.address})\n" for channel in device.channels)
+    return "📊 Отслеживаемые параметры:\n" + lines
+
+def find_device(name):
+    """Ищет устройство по имени; без имени возвращает единственное устройство"""
+    if name is None:
+        return next(iter(fleet.devices.values())) if len(fleet.devices) == 1 else None
+    return fleet.devices.get(name)
+
+# Обработка нового измерения устройства (вызывается планировщиком опроса)
+async def process_sample(device, values, timestamp):
+    """Обновляет историю каналов устройства, пишет измерения на диск и проверяет предупреждения"""
+    # Получаем текущую дату и время
+    current_time = datetime.fromtimestamp(timestamp).strftime("%d.%m.%Y %H:%M:%S")
+    expected_count = expected_samples(device)
+    prefix = f"[{device.name}] " if len(fleet.devices) > 1 else ""
+    
+    parts = []
+    updated = []
+    for channel in device.channels:
+        value = values.get(channel.name)
+        if value is None:
+            parts.append(f"{channel.title}: недоступна")
+            continue
+        updated.append(channel.name)
+        # Добавляем значение в историю (статистика окон обновляется за O(1))
+        history = device.histories[channel.name]
+        history.append(value, timestamp)
+        sample_store.add(device.key(channel.name), timestamp, value)
+        
+        # Рассчитываем среднюю температуру за час
+        hour_stats = history.stats("1h")
+        parts.append(f"{channel.title}: {value:.1f} °С | "
+                     f"Средняя за час: {hour_stats.mean:.1f} °С (измерений: {hour_stats.count}/{expected_count})")
     
-    client = ModbusTcpClient(host=MODBUS_HOST, port=MODBUS_PORT)
+    # Выводим все каналы устройства
+    print(f"{current_time} - {prefix}" + " | ".join(parts))
+    logger.debug(f"📊 {prefix}" + " | ".join(parts))
     
+    # Проверяем правила оповещения обновленных каналов
     try:
-        while True:
-            try:
-                # Переподключаемся перед каждым запросом
-                if not client.connected:
-                    if client.connect():
-                        print(Fore.GREEN + "Подключение установлено")
-                        logger.info("✅ Modbus: подключение установлено")
-                    else:
-                        print(Fore.RED + "Не удалось подключиться")
-                        logger.warning("⚠️ Modbus: не удалось подключиться")
-                        time.sleep(10)
-                        continue
-
-                # Читаем 2 регистра для температуры подачи СО
-                result = client.read_holding_registers(address=REGISTER_ADDRESS_Tpod_SO, count=2, device_id=UNIT_ID)
-
-                # Проверяем результат на ошибку
-                if hasattr(result, 'isError') and result.isError():
-                    print(Fore.RED + f"Ошибка чтения регистра температуры подачи СО: {result}")
-                    logger.error(f"❌ Modbus: ошибка чтения регистра температуры подачи СО: {result}")
-                    client.close()
-                elif not hasattr(result, 'registers'):
-                    print(Fore.RED + "Ошибка: некорректный ответ от контроллера (температура подачи СО)")
-                    logger.error("❌ Modbus: некорректный ответ, нет атрибута registers (температура подачи СО)")
-                    client.close()
-                else:
-                    # Преобразуем регистры в float для температуры подачи СО
-                    high_word = result.registers[0]
-                    low_word = result.registers[1]
-
-                    float_bytes = struct.pack('>HH', high_word, low_word)
-                    temp_pod_so_float_value = struct.unpack('>f', float_bytes)[0]
-
-                    # Сохраняем температуру в глобальную переменную (thread-safe)
-                    with temperature_lock:
-                        last_temperature = temp_pod_so_float_value
-                        # Добавляем температуру в массив для расчета среднего за час
-                        temperature_history.append(temp_pod_so_float_value)
-
-                    # Получаем текущую дату и время
-                    current_time = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-                    
-                    # Рассчитываем среднюю температуру за час
-                    with temperature_lock:
-                        if len(temperature_history) > 0:
-                            avg_temp = sum(temperature_history) / len(temperature_history)
-                            count = len(temperature_history)
-                        else:
-                            avg_temp = temp_pod_so_float_value
-                            count = 1
-                    
-                    # Читаем 2 регистра для температуры воздуха в котельной
-                    result_air = client.read_holding_registers(address=REGISTER_ADDRESS_Tvozd_kotel, count=2, device_id=UNIT_ID)
-                    
-                    # Проверяем результат на ошибку
-                    if hasattr(result_air, 'isError') and result_air.isError():
-                        print(Fore.RED + f"Ошибка чтения регистра температуры воздуха: {result_air}")
-                        logger.error(f"❌ Modbus: ошибка чтения регистра температуры воздуха: {result_air}")
-                        temp_air_float_value = None
-                        avg_temp_air = None
-                        count_air = 0
-                    elif not hasattr(result_air, 'registers'):
-                        print(Fore.RED + "Ошибка: некорректный ответ от контроллера (температура воздуха)")
-                        logger.error("❌ Modbus: некорректный ответ, нет атрибута registers (температура воздуха)")
-                        temp_air_float_value = None
-                        avg_temp_air = None
-                        count_air = 0
-                    else:
-                        # Преобразуем регистры в float для температуры воздуха
-                        high_word_air = result_air.registers[0]
-                        low_word_air = result_air.registers[1]
-
-                        float_bytes_air = struct.pack('>HH', high_word_air, low_word_air)
-                        temp_air_float_value = struct.unpack('>f', float_bytes_air)[0]
-
-                        # Сохраняем температуру воздуха в глобальную переменную (thread-safe)
-                        with temperature_air_lock:
-                            last_temperature_air = temp_air_float_value
-                            # Добавляем температуру в массив для расчета среднего за час
-                            temperature_air_history.append(temp_air_float_value)
-                            
-                            # Рассчитываем среднюю температуру воздуха за час
-                            if len(temperature_air_history) > 0:
-                                avg_temp_air = sum(temperature_air_history) / len(temperature_air_history)
-                                count_air = len(temperature_air_history)
-                            else:
-                                avg_temp_air = temp_air_float_value
-                                count_air = 1
-                    
-                    # Выводим обе температуры
-                    if temp_air_float_value is not None:
-                        print(f"{current_time} - Температура подачи СО: {temp_pod_so_float_value:.1f} °С | "
-                              f"Средняя за час: {avg_temp:.1f} °С (измерений: {count}/{TEMP_HISTORY_SIZE}) | "
-                              f"Температура воздуха: {temp_air_float_value:.1f} °С | "
-                              f"Средняя за час: {avg_temp_air:.1f} °С (измерений: {count_air}/{TEMP_HISTORY_SIZE})")
-                        logger.debug(f"📊 Температура подачи СО: {temp_pod_so_float_value:.1f} °С, средняя: {avg_temp:.1f} °С | "
-                                   f"Температура воздуха: {temp_air_float_value:.1f} °С, средняя: {avg_temp_air:.1f} °С")
-                    else:
-                        print(f"{current_time} - Температура подачи СО: {temp_pod_so_float_value:.1f} °С | "
-                              f"Средняя за час: {avg_temp:.1f} °С (измерений: {count}/{TEMP_HISTORY_SIZE}) | "
-                              f"Температура воздуха: недоступна")
-                        logger.debug(f"📊 Температура подачи СО: {temp_pod_so_float_value:.1f} °С, средняя: {avg_temp:.1f} °С | "
-                                   f"Температура воздуха: недоступна")
-                    
-                    # Проверяем температуру подачи СО и отправляем предупреждение при необходимости
-                    if bot_app:
-                        try:
-                            asyncio.run(check_and_send_low_temp_warning(bot_app, avg_temp, count))
-                        except Exception as check_error:
-                            logger.error(f"❌ Ошибка при проверке температуры: {check_error}")
-
-                    # Закрываем соединение после успешного чтения
-                    client.close()
-
-            except Exception as modbus_error:
-                print(Fore.RED + f"Ошибка при чтении: {modbus_error}")
-                logger.error(f"❌ Modbus: ошибка при чтении: {modbus_error}")
-                client.close()
-
-            # Ждем 10 секунд перед следующим запросом
-            time.sleep(10)
-
-    except KeyboardInterrupt:
-        print(Fore.YELLOW + "\nОстановка опроса...")
-        logger.info("🛑 Остановка Modbus опроса")
-    finally:
-        client.close()
-        print(Fore.GREEN + "Соединение закрыто")
-        logger.info("🔌 Modbus: соединение закрыто")
+        for event in device.alerts.on_sample(device, updated, timestamp):
+            send_alert(event)
+    except Exception as check_error:
+        logger.error(f"❌ Ошибка при проверке правил оповещения: {check_error}")
 
-# Вспомогательная функция для формирования отчёта о температуре
-def generate_temperature_report(report_title="📊 Отчет о температуре"):
-    """Формирует текст отчёта о температуре"""
-    # Получаем последнюю температуру подачи СО и рассчитываем среднюю (thread-safe)
-    with temperature_lock:
-        current_temp = last_temperature
-        # Рассчитываем среднюю температуру за час
-        if len(temperature_history) > 0:
-            avg_temp = sum(temperature_history) / len(temperature_history)
-            history_count = len(temperature_history)
+# Проверка правил, срабатывающих без новых измерений (нет данных от контроллера)
+async def check_alert_timers(_context: CallbackContext) -> None:
+    """Проверяет правила отсутствия данных всех устройств"""
+    now = time.time()
+    for device in fleet.devices.values():
+        try:
+            for event in device.alerts.on_tick(device, now):
+                send_alert(event)
+        except Exception as check_error:
+            logger.error(f"❌ [{device.name}] Ошибка при проверке правил оповещения: {check_error}")
+
+# Восстановление скользящих окон из журнала измерений
+async def restore_history():
+    """Загружает измерения за самое длинное окно из базы в историю каналов всех устройств.
+
+    База читается в отдельном потоке, а окна каждого канала строятся из загруженных
+    массивов за один проход, поэтому цикл событий не блокируется на время восстановления.
+    """
+    started = time.perf_counter()
+    since = datetime.now(timezone.utc).timestamp() - max(HISTORY_WINDOWS.values())
+    histories = {
+        device.key(channel_name): history
+        for device in fleet.devices.values()
+        for channel_name, history in device.histories.items()
+    }
+    batch = await asyncio.to_thread(load_batch, sample_store, histories, since, math.inf)
+    for key, start, count in zip(batch.keys, batch.starts, batch.counts):
+        histories[key].load(batch.times[start:start + count], batch.values[start:start + count])
+    logger.info(f"💾 Восстановлено измерений из базы: {len(batch.times)} "
+                f"за {(time.perf_counter() - started) * 1000:.0f} мс")
+
+# Периодическая запись накопленных измерений на диск
+async def flush_sample_store(_context: CallbackContext) -> None:
+    """Сбрасывает очередь измерений в базу, не блокируя цикл событий"""
+    try:
+        await asyncio.to_thread(sample_store.flush)
+    except Exception as store_error:
+        logger.error(f"❌ Ошибка записи измерений на диск: {store_error}")
+
+# Запуск опроса Modbus в цикле событий бота (вызывается после инициализации приложения)
+async def start_modbus_polling(app):
+    """Восстанавливает историю и запускает опрос устройств в цикле событий приложения"""
+    await restore_history()
+    outbox.start(app.bot)
+    fleet.start(process_sample)
+    if metrics_server:
+        try:
+            await metrics_server.start()
+        except OSError as metrics_error:
+            logger.error(f"❌ Не удалось запустить эндпоинт метрик на {METRICS_HOST}:{METRICS_PORT}: {metrics_error}")
+    logger.info("🔄 Modbus опрос запущен в цикле событий бота")
+
+# Остановка опроса Modbus при завершении работы бота
+async def stop_modbus_polling(_app):
+    """Останавливает опрос устройств и записывает измерения на диск"""
+    print(Fore.YELLOW + "\nОстановка опроса...")
+    logger.info("🛑 Остановка Modbus опроса")
+    await fleet.stop()
+    await outbox.stop()
+    if metrics_server:
+        await metrics_server.stop()
+    sample_store.close()
+    logger.info("💾 Измерения записаны на диск")
+
+# Вспомогательная функция для формирования отчёта о температуре одного устройства
+def format_device_report(device, channels=None):
+    """Формирует часть отчёта с текущими и средними значениями каналов по снимку устройства"""
+    expected_count = expected_samples(device)
+    sections = []
+    for channel in device.channels if channels is None else channels:
+        # Последнее значение и статистика за час и сутки уже посчитаны в снимке
+        hour_stats = channel.stats["1h"]
+        day_stats = channel.stats["24h"]
+        
+        if channel.last is None:
+            sections.append(
+                f"⚠️ Данные канала «{channel.title}» недоступны\n"
+                f"(возможно, нет связи с контроллером)"
+            )
+            continue
+        
+        section = f"🌡️ {channel.title}: {channel.last:.1f} °С\n"
+        # Добавляем среднюю температуру, если есть данные
+        if hour_stats.count > 0:
+            section += (
+                f"📈 Средняя температура за час: {hour_stats.mean:.1f} °С\n"
+                f"📊 Количество измерений: {hour_stats.count}/{expected_count} "
+                f"(покрыто {hour_stats.coverage / 60:.0f} мин)\n"
+                f"📉 За сутки: мин {day_stats.min:.1f} / сред {day_stats.mean:.1f} / макс {day_stats.max:.1f} °С"
+            )
         else:
-            avg_temp = None
-            history_count = 0
+            section += "⚠️ Недостаточно данных для расчета средней температуры"
+        sections.append(section)
     
-    # Получаем последнюю температуру воздуха в котельной и рассчитываем среднюю (thread-safe)
-    with temperature_air_lock:
-        current_temp_air = last_temperature_air
-        # Рассчитываем среднюю температуру воздуха за час
-        if len(temperature_air_history) > 0:
-            avg_temp_air = sum(temperature_air_history) / len(temperature_air_history)
-            history_count_air = len(temperature_air_history)
-        else:
-            avg_temp_air = None
-            history_count_air = 0
+    message = "\n\n".join(sections)
     
-    # Формируем сообщение
-    current_date = datetime.now().strftime("%d.%m.%Y")
-    current_time_utc = datetime.now(timezone.utc).strftime("%H:%M")
+    # Добавляем состояние связи, если контроллер не отвечает (шлюз при этом может быть на связи)
+    status_lines = []
+    if not device.connected and (device.failures or device.last_error):
+        status_lines.append(
+            f"🔌 Нет связи с контроллером (неудачных опросов подряд: {device.failures}, "
+            f"переподключений: {device.reconnect_count})"
+        )
+        if device.last_error:
+            status_lines.append(f"Последняя ошибка: {device.last_error}")
+    # Значения выше не текущие, если последнее измерение старше пары периодов опроса
+    if is_stale(device):
+        status_lines.append(f"🕐 Последнее измерение получено {format_age(device.sample_age)} назад")
+    if status_lines:
+        message += "\n\n" + "\n".join(status_lines)
+    if device.missed_cycles:
+        message += f"\n\n⏱️ Пропущено циклов опроса: {device.missed_cycles}"
+    return message
+
+# Краткая строка устройства для сводки по парку
+def format_device_summary(device, channels=None):
+    """Формирует одну строку сводки: текущие значения каналов по снимку устройства"""
+    values = []
+    for channel in device.channels if channels is None else channels:
+        values.append(f"{channel.last:.1f}" if channel.last is not None else "—")
+    status = "🟢" if device.connected else "🔴"
+    line = f"{status} {device.title} ({device.name}): " + " / ".join(values) + " °С"
+    if is_stale(device):
+        line += f" ({format_age(device.sample_age)} назад)"
+    return line
+
+# Устаревшие значения в отчете помечаются давностью последнего измерения
+def is_stale(device):
+    """Последнее измерение устройства старше STALE_PERIODS периодов опроса на момент снимка"""
+    age = device.sample_age
+    return age is not None and age > device.poll_interval * STALE_PERIODS
+
+def format_age(seconds):
+    """Давность в виде "45 сек", "12 мин" или "2 ч 05 мин" """
+    return f"{seconds:.0f} сек" if seconds < 60 else format_duration(seconds)
+
+# Вспомогательная функция для формирования отчёта о температуре
+def generate_temperature_report(report_title="📊 Отчет о температуре", devices=None, subscription=None):
+    """Возвращает текст отчёта о температуре по выбранным устройствам (по умолчанию - по всем).
+
+    Отчет строится по последнему опубликованному снимку и запоминается до следующего
+    цикла опроса устройств, попавших в отчет: повторные запросы - поиск в словаре.
+    Если задана подписка, в отчет попадают только каналы из ее фильтра.
+    """
+    names = None if devices is None else tuple(device.name for device in devices)
+    audience = subscription.audience if subscription is not None else None
+    return report_cache.get(
+        fleet.snapshots.current, names or tuple(fleet.devices), (report_title, names, audience),
+        functools.partial(render_temperature_report, report_title, names, subscription),
+    )
+
+def render_temperature_report(report_title, names, subscription, snapshot):
+    """Формирует текст отчёта по снимку парка"""
+    devices = [snapshot.devices[name] for name in (names or fleet.devices) if name in snapshot.devices]
+    selected = {device.name: None for device in devices}
+    if subscription is not None and subscription.channels is not None:
+        selected = {
+            device.name: [channel for channel in device.channels if subscription.wants_channel(device, channel.name)]
+            for device in devices
+        }
+        devices = [device for device in devices if selected[device.name]]
     
+    # Время отчета - время самого свежего снимка из попавших в отчет устройств
+    timestamp = max((device.timestamp for device in devices), default=snapshot.timestamp)
+    snapshot_time = datetime.fromtimestamp(timestamp, timezone.utc)
     message = (
         f"{report_title}\n\n"
-        f"📅 Дата: {current_date}\n"
-        f"🕐 Время: {current_time_utc} UTC\n\n"
+        f"📅 Дата: {snapshot_time.astimezone().strftime('%d.%m.%Y')}\n"
+        f"🕐 Время: {snapshot_time.strftime('%H:%M')} UTC\n\n"
     )
     
-    # Добавляем информацию о температуре подачи СО
-    if current_temp is not None:
-        message += f"🌡️ Текущая температура подачи СО: {current_temp:.1f} °С\n"
-        
-        # Добавляем среднюю температуру, если есть данные
-        if avg_temp is not None and history_count > 0:
-            message += f"📈 Средняя температура за час: {avg_temp:.1f} °С\n"
-            message += f"📊 Количество измерений: {history_count}/{TEMP_HISTORY_SIZE}\n"
-        else:
-            message += f"⚠️ Недостаточно данных для расчета средней температуры\n"
-    else:
-        message += (
-            f"⚠️ Данные о температуре подачи СО недоступны\n"
-            f"(возможно, нет связи с контроллером)\n"
-        )
-    
-    # Добавляем информацию о температуре воздуха в котельной
-    message += "\n"
-    if current_temp_air is not None:
-        message += f"🌡️ Текущая температура воздуха в котельной: {current_temp_air:.1f} °С\n"
-        
-        # Добавляем среднюю температуру воздуха, если есть данные
-        if avg_temp_air is not None and history_count_air > 0:
-            message += f"📈 Средняя температура за час: {avg_temp_air:.1f} °С\n"
-            message += f"📊 Количество измерений: {history_count_air}/{TEMP_HISTORY_SIZE}"
-        else:
-            message += f"⚠️ Недостаточно данных для расчета средней температуры воздуха"
+    if len(devices) > FULL_REPORT_MAX_DEVICES:
+        # Для большого парка - по строке на устройство
+        message += "\n".join(format_device_summary(device, selected[device.name]) for device in devices)
+        message += "\n\n💡 Подробнее: /temperature <устройство>"
+    elif len(devices) == 1 and len(fleet.devices) == 1:
+        message += format_device_report(devices[0], selected[devices[0].name])
+    elif not devices:
+        message += "⚠️ Нет каналов, подходящих под фильтр подписки"
     else:
-        message += (
-            f"⚠️ Данные о температуре воздуха недоступны\n"
-            f"(возможно, нет связи с контроллером)"
+        message += "\n\n".join(
+            f"🏭 {device.title}\n{format_device_report(device, selected[device.name])}" for device in devices
         )
     
     return message
 
+# Нижний порог канала для градусо-часов берется из порогового правила оповещения устройства
+def channel_threshold(device, channel_name):
+    """Возвращает порог below первого порогового правила канала или None"""
+    for rule in device.alerts.rules:
+        if isinstance(rule, ThresholdRule) and rule.channel == channel_name and rule.below is not None:
+            return rule.below
+    return None
+
+# Сводная аналитика по журналу измерений за сутки или неделю
+def build_summary(period, devices=None, now=None):
+    """Загружает сырые измерения всех каналов за период одним пакетом и считает показатели.
+
+    Выполняется в отдельном потоке: чтение базы - основная часть времени, сами расчеты
+    идут пакетно по всему буферу. Возвращает (пакет, показатели, {устройство: (r, пар)}).
+    """
+    devices = list(fleet.devices.values()) if devices is None else devices
+    until = time.time() if now is None else now
+    since = until - SUMMARY_PERIODS[period]
+    channels = [(device, channel) for device in devices for channel in device.channels]
+    batch = load_batch(sample_store, [device.key(channel.name) for device, channel in channels], since, until)
+    thresholds = [channel_threshold(device, channel.name) for device, channel in channels]
+    stats = summarize(
+        batch, since, until,
+        [device.poll_interval for device, _ in channels],
+        [np.nan if threshold is None else threshold for threshold in thresholds],
+    )
+    # Корреляция подачи СО и воздуха в котельной для устройств, где есть оба канала
+    paired = [device for device in devices if device.key(LOW_TEMP_CHANNEL) in batch.index
+              and device.key(AIR_TEMP_CHANNEL) in batch.index]
+    coefficients, counts = correlate(batch, [
+        (batch.index[device.key(LOW_TEMP_CHANNEL)], batch.index[device.key(AIR_TEMP_CHANNEL)]) for device in paired
+    ])
+    correlation = {device.name: (coefficient, count) for device, coefficient, count in zip(paired, coefficients, counts)}
+    return batch, stats, correlation
+
+def format_summary(summary, period, devices=None, subscription=None):
+    """Формирует текст сводки за период; для большого парка - по строке на канал"""
+    batch, stats, correlation = summary
+    devices = list(fleet.devices.values()) if devices is None else devices
+    compact = len(devices) > FULL_REPORT_MAX_DEVICES
+    sections = []
+    for device in devices:
+        channels = [channel for channel in device.channels
+                    if subscription is None or subscription.wants_channel(device, channel.name)]
+        if not channels:
+            continue
+        if compact:
+            sections.append("\n".join(
+                format_channel_line(device.key(channel.name), stats, batch.index[device.key(channel.name)])
+                for channel in channels
+            ))
+            continue
+        blocks = [
+            format_channel_summary(channel.title, stats, batch.index[device.key(channel.name)],
+                                   channel_threshold(device, channel.name))
+            for channel in channels
+        ]
+        selected = {channel.name for channel in channels}
+        if device.name in correlation and {LOW_TEMP_CHANNEL, AIR_TEMP_CHANNEL} <= selected:
+            coefficient, count = correlation[device.name]
+            if count < MIN_CORRELATION_SAMPLES:
+                blocks.append("🔗 Корреляция подачи СО и воздуха в котельной: недостаточно данных")
+            elif np.isnan(coefficient):
+                # Один из каналов весь период показывал одно значение
+                blocks.append(
+                    f"🔗 Корреляция подачи СО и воздуха в котельной: не определена, "
+                    f"постоянный сигнал (пар измерений: {count})"
+                )
+            else:
+                blocks.append(f"🔗 Корреляция подачи СО и воздуха в котельной: {coefficient:+.2f} (пар измерений: {count})")
+        sections.append((f"🏭 {device.title}\n" if len(fleet.devices) > 1 else "") + "\n\n".join(blocks))
+    
+    if not sections:
+        return f"📈 Сводка за {period}\n\n⚠️ Нет каналов, подходящих под фильтр подписки"
+    return f"📈 Сводка за {period}\n\n" + "\n\n".join(sections)
+
 # Асинхронная функция для ежедневной отправки температуры
 async def daily_temperature_report(context: CallbackContext) -> None:
-    """Ежедневно отправляет отчет о температуре"""
+    """Ежедневно отправляет отчет о температуре всем подписчикам"""
     logger.info("🕐 Запуск ежедневного отчета о температуре")
     
-    if not TELEGRAM_CHAT_ID:
-        logger.warning("⚠️ TELEGRAM_CHAT_ID не настроен, пропускаем отправку отчета")
+    audiences = subscribers.report_audiences()
+    if not audiences:
+        logger.warning("⚠️ Нет подписчиков и не настроен TELEGRAM_CHAT_ID, пропускаем отправку отчета")
         return
     
+    # Суточная сводка считается один раз для всех каналов парка; перед этим дописываем очередь измерений
     try:
-        message = generate_temperature_report("📊 Ежедневный отчет о температуре")
-        
-        # Отправляем сообщение
-        await context.bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message)
-        logger.success("✅ Ежедневный отчет о температуре отправлен")
-        
-    except Exception as report_error:
-        logger.error(f"❌ Ошибка при отправке ежедневного отчета: {report_error}")
+        await asyncio.to_thread(sample_store.flush)
+        summary = await asyncio.to_thread(build_summary, "24h")
+    except Exception as summary_error:
+        logger.error(f"❌ Ошибка при расчете суточной сводки: {summary_error}")
+        summary = None
+    
+    # Отчет формируется один раз на аудиторию (одинаковый фильтр каналов), а не на каждый чат
+    queued = 0
+    for subscription, chat_ids in audiences.values():
         try:
-            await context.bot.send_message(
-                chat_id=TELEGRAM_CHAT_ID,
-                text=f"❌ Ошибка при формировании отчета:\n{str(report_error)}"
-            )
-        except Exception as send_error:
-            logger.error(f"❌ Не удалось отправить сообщение об ошибке: {send_error}")
+            message = generate_temperature_report("📊 Ежедневный отчет о температуре", subscription=subscription)
+            if summary is not None:
+                message += "\n\n" + format_summary(summary, "24h", subscription=subscription)
+        except Exception as report_error:
+            logger.error(f"❌ Ошибка при формировании ежедневного отчета: {report_error}")
+            message = f"❌ Ошибка при формировании отчета:\n{str(report_error)}"
+        # Рассылка идет параллельно обработчиками очереди с общим ограничением частоты
+        queued += outbox.broadcast(chat_ids, message)
+    logger.success(f"✅ Ежедневный отчет поставлен в очередь: чатов {queued}, вариантов отчета {len(audiences)}")
 
 # Обработчик команды /temperature для показа температуры по запросу
-async def temperature_command(update, _context: CallbackContext) -> None:
-    """Обрабатывает команду /temperature и отправляет текущую температуру"""
+async def temperature_command(update, context: CallbackContext) -> None:
+    """Обрабатывает команду /temperature [устройство] и отправляет текущую температуру"""
     logger.info(f"📱 Получена команда /temperature от пользователя {update.effective_user.id}")
+    started = time.perf_counter()
+    try:
+        await send_temperature(update, context)
+    finally:
+        COMMAND_SECONDS.labels("temperature").observe(time.perf_counter() - started)
+
+async def send_temperature(update, context: CallbackContext) -> None:
+    """Формирует и отправляет ответ на /temperature"""
+    devices = None
+    if context.args:
+        device = find_device(context.args[0])
+        if device is None:
+            await update.message.reply_text(f"Неизвестное устройство. Доступные: {', '.join(fleet.devices)}")
+            return
+        devices = [device]
     
     try:
-        message = generate_temperature_report("🌡️ Текущая температура отопления")
+        message = generate_temperature_report("🌡️ Текущая температура отопления", devices)
         
         # Отправляем сообщение
         await update.message.reply_text(message)
@@ -368,41 +590,239 @@ async def temperature_command(update, _context: CallbackContext) -> None:
         except Exception as send_error:
             logger.error(f"❌ Не удалось отправить сообщение об ошибке: {send_error}")
 
+# Обработчик команды /history <период> [устройство] (минимум/среднее/максимум по интервалам)
+async def history_command(update, context: CallbackContext) -> None:
+    """Обрабатывает команду /history и отправляет историю температур за период"""
+    logger.info(f"📱 Получена команда /history от пользователя {update.effective_user.id}")
+    period = context.args[0] if context.args else "24h"
+    device = find_device(context.args[1] if len(context.args) > 1 else None)
+    if period not in HISTORY_PERIODS or device is None:
+        await update.message.reply_text(
+            f"Использование: /history <период> [устройство]\n"
+            f"Периоды: {', '.join(HISTORY_PERIODS)}\n"
+            f"Устройства: {', '.join(fleet.devices)}"
+        )
+        return
+    
+    try:
+        series = [(device.key(channel.name), channel.title) for channel in device.channels]
+        message = await asyncio.to_thread(format_history, sample_store, series, period)
+        await update.message.reply_text(device_label(device) + message)
+        logger.info(f"✅ История {device.name} за {period} отправлена")
+        
+    except Exception as cmd_error:
+        logger.error(f"❌ Ошибка при обработке команды /history: {cmd_error}")
+        try:
+            await update.message.reply_text(f"❌ Ошибка при получении истории температуры:\n{str(cmd_error)}")
+        except Exception as send_error:
+            logger.error(f"❌ Не удалось отправить сообщение об ошибке: {send_error}")
+
+# Обработчик команды /summary <период> [устройство] (суточная или недельная сводка по журналу)
+async def summary_command(update, context: CallbackContext) -> None:
+    """Обрабатывает команду /summary и отправляет сводку за сутки или неделю"""
+    logger.info(f"📱 Получена команда /summary от пользователя {update.effective_user.id}")
+    period = context.args[0] if context.args else "24h"
+    devices = None
+    if len(context.args) > 1:
+        device = find_device(context.args[1])
+        devices = [device] if device is not None else []
+    if period not in SUMMARY_PERIODS or devices == []:
+        await update.message.reply_text(
+            f"Использование: /summary <период> [устройство]\n"
+            f"Периоды: {', '.join(SUMMARY_PERIODS)}\n"
+            f"Устройства: {', '.join(fleet.devices)}"
+        )
+        return
+    
+    started = time.perf_counter()
+    try:
+        summary = await asyncio.to_thread(build_summary, period, devices)
+        await update.message.reply_text(format_summary(summary, period, devices))
+        logger.info(f"✅ Сводка за {period} отправлена")
+        
+    except Exception as cmd_error:
+        logger.error(f"❌ Ошибка при обработке команды /summary: {cmd_error}")
+        try:
+            await update.message.reply_text(f"❌ Ошибка при расчете сводки:\n{str(cmd_error)}")
+        except Exception as send_error:
+            logger.error(f"❌ Не удалось отправить сообщение об ошибке: {send_error}")
+    finally:
+        COMMAND_SECONDS.labels("summary").observe(time.perf_counter() - started)
+
+# Обработчик команды /chart <канал> <период> (PNG-график); в режиме парка канал задается как устройство/канал
+async def chart_command(update, context: CallbackContext) -> None:
+    """Обрабатывает команду /chart и отправляет график температуры за период"""
+    logger.info(f"📱 Получена команда /chart от пользователя {update.effective_user.id}")
+    channel_spec = context.args[0] if context.args else None
+    period = context.args[1] if len(context.args) > 1 else "24h"
+    
+    device_name, _, channel_name = (channel_spec or "").rpartition("/")
+    device = find_device(device_name or None)
+    if device is not None and not channel_name:
+        channel_name = device.channels[0].name
+    channel = next((ch for ch in device.channels if ch.name == channel_name), None) if device else None
+    if channel is None or period not in HISTORY_PERIODS:
+        examples = [ch.name for ch in device.channels] if device else [
+            f"{name}/<канал>" for name in list(fleet.devices)[:FULL_REPORT_MAX_DEVICES]
+        ]
+        await update.message.reply_text(
+            f"Использование: /chart <канал> <период>\n"
+            f"Каналы: {', '.join(examples)}\n"
+            f"Периоды: {', '.join(HISTORY_PERIODS)}"
+        )
+        return
+    
+    title = f"{device.title}: {channel.title}" if len(fleet.devices) > 1 else channel.title
+    try:
+        image = await get_chart(sample_store, chart_cache, device.key(channel.name), title, period)
+        if image is None:
+            await update.message.reply_text(f"⚠️ Нет данных для графика за {period}")
+            return
+        await update.message.reply_photo(photo=image, caption=f"{title}, {period}")
+        logger.info(f"✅ График {device.key(channel.name)} за {period} отправлен")
+        
+    except Exception as cmd_error:
+        logger.error(f"❌ Ошибка при обработке команды /chart: {cmd_error}")
+        try:
+            await update.message.reply_text(f"❌ Ошибка при построении графика:\n{str(cmd_error)}")
+        except Exception as send_error:
+            logger.error(f"❌ Не удалось отправить сообщение об ошибке: {send_error}")
+
+# Разбор фильтров /subscribe: каналы и устройства отдельно от типов оповещений
+def parse_subscription_filters(args):
+    """Возвращает (каналы, типы оповещений, нераспознанные аргументы)"""
+    channel_names = {device.name for device in fleet.devices.values()}
+    rule_names = set(RULE_TYPES)
+    for device in fleet.devices.values():
+        for channel in device.channels:
+            channel_names.update((channel.name, device.key(channel.name)))
+        rule_names.update(rule.name for rule in device.alerts.rules)
+    
+    channels, alert_types, unknown = [], [], []
+    for arg in args:
+        if arg in channel_names:
+            channels.append(arg)
+        elif arg in rule_names:
+            alert_types.append(arg)
+        else:
+            unknown.append(arg)
+    return channels, alert_types, unknown
+
+# Обработчик команды /subscribe [каналы/устройства] [типы оповещений]
+async def subscribe_command(update, context: CallbackContext) -> None:
+    """Подписывает чат на ежедневные отчеты и оповещения (с фильтрами или без)"""
+    chat_id = update.effective_chat.id
+    logger.info(f"📱 Получена команда /subscribe от пользователя {update.effective_user.id} в чате {chat_id}")
+    channels, alert_types, unknown = parse_subscription_filters(context.args or [])
+    if unknown:
+        await update.message.reply_text(
+            f"Неизвестные фильтры: {', '.join(unknown)}\n"
+            f"Использование: /subscribe [канал | устройство | устройство/канал ...] [тип оповещения ...]\n"
+            f"Типы оповещений: {', '.join(RULE_TYPES)}"
+        )
+        return
+    
+    try:
+        subscription = subscribers.subscribe(chat_id, channels, alert_types)
+        await update.message.reply_text(f"✅ Чат подписан на отчеты и оповещения ({subscription.describe()})")
+        logger.info(f"👥 Чат {chat_id} подписан: {subscription.describe()}")
+    except Exception as cmd_error:
+        logger.error(f"❌ Ошибка при обработке команды /subscribe: {cmd_error}")
+        await update.message.reply_text(f"❌ Не удалось сохранить подписку:\n{str(cmd_error)}")
+
+# Обработчик команды /unsubscribe
+async def unsubscribe_command(update, context: CallbackContext) -> None:
+    """Отписывает чат от отчетов и оповещений"""
+    chat_id = update.effective_chat.id
+    logger.info(f"📱 Получена команда /unsubscribe от пользователя {update.effective_user.id} в чате {chat_id}")
+    try:
+        removed = subscribers.unsubscribe(chat_id)
+    except Exception as cmd_error:
+        logger.error(f"❌ Ошибка при обработке команды /unsubscribe: {cmd_error}")
+        await update.message.reply_text(f"❌ Не удалось удалить подписку:\n{str(cmd_error)}")
+        return
+    
+    if str(chat_id) == subscribers.default_chat_id:
+        await update.message.reply_text("ℹ️ Этот чат задан в TELEGRAM_CHAT_ID и получает все сообщения без подписки")
+    elif removed:
+        await update.message.reply_text("✅ Чат отписан от отчетов и оповещений")
+        logger.info(f"👥 Чат {chat_id} отписан")
+    else:
+        await update.message.reply_text("ℹ️ Чат не был подписан")
+
 # Главная функция
 def main():
     """Запускает Telegram бота и Modbus опрос"""
     # Создаём приложение Telegram-бота
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+    # Опрос Modbus запускается и останавливается вместе с циклом событий приложения
+    # Команды обрабатываются параллельно: медленный /chart не задерживает /temperature
+    builder = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(MAX_CONCURRENT_UPDATES)
+        .post_init(start_modbus_polling)
+        .post_stop(stop_modbus_polling)
+    )
+    if TELEGRAM_API_URL:
+        builder.base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot").base_file_url(f"{TELEGRAM_API_URL.rstrip('/')}/file/bot")
+    app = builder.build()
     
     # Регистрируем обработчик команды /temperature
     app.add_handler(CommandHandler("temperature", temperature_command))
     logger.info("📝 Зарегистрирована команда /temperature")
+    app.add_handler(CommandHandler("history", history_command))
+    app.add_handler(CommandHandler("chart", chart_command))
+    logger.info("📝 Зарегистрированы команды /history и /chart")
+    app.add_handler(CommandHandler("summary", summary_command))
+    logger.info("📝 Зарегистрирована команда /summary")
+    app.add_handler(CommandHandler("subscribe", subscribe_command))
+    app.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
+    logger.info("📝 Зарегистрированы команды /subscribe и /unsubscribe")
+    
+    # Периодически записываем измерения на диск
+    app.job_queue.run_repeating(flush_sample_store, interval=STORE_FLUSH_INTERVAL, first=STORE_FLUSH_INTERVAL)
+    # Проверяем отсутствие данных от контроллеров
+    app.job_queue.run_repeating(check_alert_timers, interval=POLL_INTERVAL, first=POLL_INTERVAL)
     
     # Отправляем уведомление о запуске (выполнится один раз через 2 секунды)
     app.job_queue.run_once(
-        lambda context: send_startup_notification(app),
+        send_startup_notification,
         when=2
     )
     
-    # Планируем ежедневную отправку температуры в 01:00 UTC
-    app.job_queue.run_daily(
-        daily_temperature_report,
-        time=dtime(hour=1, minute=0)
-    )
+    # Планируем ежедневную отправку температуры в 01:00 UTC и 14:00 UTC
+    for report_time in DAILY_REPORT_TIMES:
+        app.job_queue.run_daily(
+            daily_temperature_report,
+            time=report_time
+        )
 
     logger.success("🚀 Telegram бот настроен")
     logger.info("⏰ Расписание: отчеты о температуре каждый день в 01:00 UTC и 14:00 UTC")
     
-    # Запускаем Modbus опрос в отдельном потоке с передачей объекта бота
-    modbus_thread = threading.Thread(target=modbus_polling_loop, args=(app,), daemon=True)
-    modbus_thread.start()
-    logger.info("🔄 Modbus опрос запущен в отдельном потоке")
-    
     print(Fore.GREEN + "✅ Бот запущен. Ожидание команд и выполнение по расписанию..." + Fore.RESET)
     print(Fore.CYAN + "⏰ Ежедневные отчеты о температуре: 01:00 UTC и 14:00 UTC" + Fore.RESET)
     
-    # Запускаем polling — бот начинает работу
-    app.run_polling()
+    if not TELEGRAM_WEBHOOK_URL:
+        # Запускаем polling — бот начинает работу
+        app.run_polling()
+        return
+    
+    # Вебхук: Telegram сам присылает обновления, ответ на команду не ждет очередного getUpdates
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    logger.info(
+        f"🌐 Режим вебхука: слушаем {WEBHOOK_LISTEN}:{WEBHOOK_PORT}, внешний адрес {TELEGRAM_WEBHOOK_URL}, "
+        f"одновременно обновлений: {MAX_CONCURRENT_UPDATES}"
+    )
+    app.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=secret,
+        webhook_url=f"{TELEGRAM_WEBHOOK_URL.rstrip('/')}/{secret}",
+        secret_token=secret,
+        # Telegram допускает от 1 до 100 одновременных соединений вебхука
+        max_connections=min(max(MAX_CONCURRENT_UPDATES, 1), 100),
+    )
 
 # Точка входа в программу
 if __name__ == "__main__":
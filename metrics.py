@@ -0,0 +1,252 @@
+"""Метрики в текстовом формате Prometheus и HTTP-эндпоинт для них"""
+import asyncio
+from bisect import bisect_left
+
+from loguru import logger
+
+# Границы корзин гистограмм задержек по умолчанию, сек
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # Последняя корзина - +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """Семейство метрик с метками; значения для набора меток создаются при первом обращении.
+
+    Обновление значения - несколько арифметических операций без блокировок: все метрики
+    меняются из одного цикла событий.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._new_value()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Возвращает значение метрики для набора меток (порядок как в labelnames)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}")
+            child = self._children[values] = self._new_value()
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._children.items():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+
+class Gauge(Metric):
+    """Текущее значение; может вычисляться функцией в момент запроса метрик"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self._function = None
+
+    def _new_value(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self._children[()].set(value)
+
+    def set_function(self, function):
+        self._function = function
+
+    def render(self):
+        if self._function is not None:
+            self._children[()].set(self._function())
+        return super().render()
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными корзинами: observe() - бинарный поиск и два сложения"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_value(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(float(bound))}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик, отдаваемых одним эндпоинтом"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+
+    def render(self):
+        """Возвращает все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Метрики опроса Modbus
+MODBUS_CONNECT_SECONDS = Histogram(
+    "modbus_connect_seconds", "Время установки соединения с шлюзом Modbus TCP", ["gateway"])
+MODBUS_REQUEST_SECONDS = Histogram(
+    "modbus_request_seconds", "Время ответа на запрос чтения регистров", ["gateway"])
+MODBUS_CYCLE_SECONDS = Histogram(
+    "modbus_cycle_seconds", "Длительность полного цикла опроса устройства", ["device"])
+MODBUS_READ_ERRORS = Counter(
+    "modbus_read_errors_total", "Ошибки чтения по типу: ответ с ошибкой, исключение, таймаут, занят шлюз", ["device", "kind"])
+MODBUS_RECONNECTS = Counter(
+    "modbus_reconnects_total", "Повторные подключения к шлюзу после обрыва связи", ["gateway"])
+MODBUS_MISSED_CYCLES = Counter(
+    "modbus_missed_cycles_total", "Пропущенные сроки опроса (цикл не уложился в период)", ["device"])
+
+# Метрики Telegram
+TELEGRAM_SEND_SECONDS = Histogram(
+    "telegram_send_seconds", "Время отправки сообщения в Telegram API")
+TELEGRAM_MESSAGES_QUEUED = Counter(
+    "telegram_messages_queued_total", "Сообщения, поставленные в очередь отправки")
+TELEGRAM_QUEUE_PENDING = Gauge(
+    "telegram_queue_pending", "Сообщения, ожидающие отправки")
+COMMAND_SECONDS = Histogram(
+    "telegram_command_seconds", "Время обработки команды бота", ["command"])
+
+
+class MetricsServer:
+    """Минимальный HTTP-сервер на asyncio: GET /metrics отдает registry.render()"""
+
+    def __init__(self, host="127.0.0.1", port=9108, registry=None):
+        self.host = host
+        self.port = port
+        self.registry = REGISTRY if registry is None else registry
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"📈 Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки запроса не нужны, но их нужно дочитать до пустой строки
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, content_type, body = "200 OK", CONTENT_TYPE, self.registry.render().encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as error:
+            logger.debug(f"Метрики: запрос прерван: {error}")
+        finally:
+            writer.close()
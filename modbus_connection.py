@@ -0,0 +1,170 @@
+"""Постоянное соединение Modbus TCP с переподключением и экспоненциальной задержкой"""
+import asyncio
+import random
+import time
+
+from colorama import Fore
+from loguru import logger
+from pymodbus.client import AsyncModbusTcpClient
+from pymodbus.exceptions import ConnectionException, ModbusIOException
+
+from metrics import MODBUS_CONNECT_SECONDS, MODBUS_RECONNECTS, MODBUS_REQUEST_SECONDS
+
+# Состояния соединения
+STATE_DISCONNECTED = "disconnected"
+STATE_CONNECTED = "connected"
+STATE_BACKOFF = "backoff"
+
+# Сколько запросов подряд без ответа pymodbus терпит, прежде чем сам закроет соединение.
+# Молчащее устройство за шлюзом не должно рвать сокет, общий для всех устройств шлюза
+MAX_NO_RESPONSES = 20
+
+
+class ReconnectBackoff:
+    """Экспоненциальная задержка между попытками подключения со случайным разбросом"""
+
+    def __init__(self, initial=1.0, maximum=300.0, factor=2.0, jitter=0.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempt = 0
+
+    def next_delay(self):
+        """Возвращает задержку до следующей попытки и увеличивает счетчик попыток"""
+        delay = min(self.maximum, self.initial * (self.factor ** self.attempt))
+        self.attempt += 1
+        # Разброс не дает нескольким клиентам одновременно ломиться в шлюз после сбоя
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        """Сбрасывает задержку после успешного подключения"""
+        self.attempt = 0
+
+
+class ModbusConnectionManager:
+    """Держит сессию AsyncModbusTcpClient открытой между циклами опроса"""
+
+    def __init__(self, host, port, timeout=3, backoff=None, client=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        # Клиент создается при первом подключении: ему нужен запущенный цикл событий
+        self.client = client
+        self.backoff = backoff or ReconnectBackoff()
+        self.state = STATE_DISCONNECTED
+        self.connected_since = None
+        self.next_attempt_at = 0.0
+        self.reconnect_count = 0
+        self.connect_count = 0
+        self.last_error = None
+        self.last_error_at = None
+        # Значения метрик этого шлюза берутся один раз, чтобы не искать их на каждом запросе
+        label = f"{host}:{port}"
+        self._connect_seconds = MODBUS_CONNECT_SECONDS.labels(label)
+        self._request_seconds = MODBUS_REQUEST_SECONDS.labels(label)
+        self._reconnects = MODBUS_RECONNECTS.labels(label)
+
+    async def ensure_connected(self):
+        """Возвращает True, если соединение открыто; иначе пытается подключиться с учетом задержки"""
+        if self.state == STATE_CONNECTED and self.client is not None and self.client.connected:
+            return True
+        if self.state == STATE_CONNECTED:
+            # Сокет закрылся без нашего ведома
+            self.mark_failed("соединение закрыто удаленной стороной")
+        if time.monotonic() < self.next_attempt_at:
+            return False
+
+        if self.client is None:
+            # Встроенное переподключение pymodbus отключено: задержками управляет ReconnectBackoff
+            self.client = AsyncModbusTcpClient(host=self.host, port=self.port, timeout=self.timeout,
+                                               retries=0, reconnect_delay=0)
+            self.client.set_max_no_responses(MAX_NO_RESPONSES)
+        started = time.perf_counter()
+        connected = await self.client.connect()
+        self._connect_seconds.observe(time.perf_counter() - started)
+        if connected:
+            if self.connect_count > 0:
+                self.reconnect_count += 1
+                self._reconnects.inc()
+            self.connect_count += 1
+            self.state = STATE_CONNECTED
+            self.connected_since = time.monotonic()
+            self.backoff.reset()
+            print(Fore.GREEN + "Подключение установлено")
+            logger.info(f"✅ Modbus: подключение к {self.host}:{self.port} установлено")
+            return True
+
+        self.mark_failed("не удалось подключиться")
+        print(Fore.RED + "Не удалось подключиться")
+        logger.warning(f"⚠️ Modbus: не удалось подключиться к {self.host}:{self.port}, "
+                       f"следующая попытка через {self.next_attempt_at - time.monotonic():.1f} сек")
+        return False
+
+    async def read_holding_registers(self, address, count, device_id, timeout=None):
+        """Читает регистры устройства device_id, ожидая ответ не дольше timeout (по умолчанию - таймаут соединения).
+
+        Нет ответа от одного устройства - ошибка этого устройства: сокет общий для всех
+        устройств шлюза и остается открытым. Закрывается он и уходит в задержку
+        переподключения только при ошибке транспорта (обрыв, отказ в соединении).
+        """
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self._read(address, count, device_id), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            error = ModbusIOException(f"нет ответа от устройства {device_id} за {timeout or self.timeout:g} сек")
+            self._check_transport(error)
+            raise error from None
+        except (ConnectionException, OSError) as error:
+            self.mark_failed(error)
+            raise
+        except ModbusIOException as error:
+            self._check_transport(error)
+            raise
+        finally:
+            self._request_seconds.observe(time.perf_counter() - started)
+        if isinstance(result, ModbusIOException):
+            self._check_transport(result)
+        return result
+
+    async def _read(self, address, count, device_id):
+        try:
+            return await self.client.read_holding_registers(address=address, count=count, device_id=device_id)
+        except ModbusIOException as error:
+            if isinstance(error.__cause__, asyncio.CancelledError):
+                # pymodbus превращает отмену запроса в ModbusIOException; отмена должна дойти до вызывающего
+                raise asyncio.CancelledError() from error
+            raise
+
+    def _check_transport(self, error):
+        """После ошибки ввода-вывода закрывает соединение, только если сокет действительно закрыт"""
+        if not self.client.connected:
+            self.mark_failed(error)
+
+    def mark_failed(self, error):
+        """Фиксирует ошибку, закрывает сокет и откладывает следующую попытку подключения"""
+        self.last_error = str(error)
+        self.last_error_at = time.time()
+        if self.client is not None:
+            self.client.close()
+        self.state = STATE_BACKOFF
+        self.connected_since = None
+        self.next_attempt_at = time.monotonic() + self.backoff.next_delay()
+
+    def close(self):
+        """Закрывает соединение"""
+        if self.client is not None:
+            self.client.close()
+        self.state = STATE_DISCONNECTED
+        self.connected_since = None
+
+    def status(self):
+        """Возвращает состояние соединения: аптайм, число переподключений, последняя ошибка"""
+        uptime = time.monotonic() - self.connected_since if self.connected_since is not None else 0.0
+        return {
+            "state": self.state,
+            "uptime": uptime,
+            "reconnect_count": self.reconnect_count,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+        }
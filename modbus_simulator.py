@@ -0,0 +1,186 @@
+"""Локальный имитатор контроллеров Modbus TCP: сигналы по формулам, задержки, ошибки и обрывы связи
+
+Запуск: python modbus_simulator.py --port 5020 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass
+import math
+import random
+import time
+
+from loguru import logger
+from pymodbus.constants import ExcCodes
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.datastore.context import ModbusBaseDeviceContext
+from pymodbus.server import ModbusTcpServer
+
+from register_map import REGISTER_MAP
+
+# Формы сигнала
+WAVEFORMS = ("constant", "sine", "ramp", "square")
+
+# Регистров в адресном пространстве имитатора
+ADDRESS_SPACE = 65536
+
+
+@dataclass
+class Waveform:
+    """Сигнал канала: mean + amplitude * форма(t / period) + гауссов шум"""
+    kind: str = "sine"
+    mean: float = 40.0
+    amplitude: float = 5.0
+    period: float = 3600.0
+    phase: float = 0.0
+    noise: float = 0.0
+
+    def __post_init__(self):
+        if self.kind not in WAVEFORMS:
+            raise ValueError(f"Неизвестная форма сигнала '{self.kind}'")
+
+    def value(self, t, rng=random):
+        position = (t / self.period + self.phase) % 1.0
+        if self.kind == "sine":
+            shape = math.sin(2 * math.pi * position)
+        elif self.kind == "ramp":
+            shape = 2 * position - 1
+        elif self.kind == "square":
+            shape = 1.0 if position < 0.5 else -1.0
+        else:
+            shape = 0.0
+        value = self.mean + self.amplitude * shape
+        if self.noise:
+            value += rng.gauss(0.0, self.noise)
+        return value
+
+
+@dataclass
+class FaultProfile:
+    """Внедряемые неисправности: задержка ответа, ответ-исключение Modbus, обрыв соединения"""
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    disconnect_rate: float = 0.0
+
+
+class SimulatedDevice(ModbusBaseDeviceContext):
+    """Контроллер с одним unit id: holding-регистры вычисляются из сигналов в момент запроса"""
+
+    def __init__(self, channels, waveforms=None, faults=None, seed=None):
+        self.channels = list(channels)
+        self.waveforms = dict(waveforms or {})
+        self.faults = faults or FaultProfile()
+        self.rng = random.Random(seed)
+        self.started = time.monotonic()
+        self.simulator = None
+        self.requests = 0
+        self.errors = 0
+        self.disconnects = 0
+
+    def waveform(self, channel):
+        return self.waveforms.get(channel.name) or Waveform()
+
+    async def async_getValues(self, func_code, address, count=1):
+        self.requests += 1
+        faults = self.faults
+        if faults.latency or faults.jitter:
+            await asyncio.sleep(faults.latency + self.rng.uniform(0.0, faults.jitter))
+        roll = self.rng.random()
+        if roll < faults.disconnect_rate and self.simulator is not None:
+            # Соединение рвется без ответа, как при пропаже связи с GSM-шлюзом
+            self.disconnects += 1
+            self.simulator.drop_connections()
+            return ExcCodes.GATEWAY_NO_RESPONSE
+        if roll < faults.disconnect_rate + faults.error_rate:
+            self.errors += 1
+            return ExcCodes.DEVICE_FAILURE
+        return self.getValues(func_code, address, count)
+
+    def getValues(self, func_code, address, count=1):
+        if self.decode(func_code) != "h":
+            return ExcCodes.ILLEGAL_FUNCTION
+        if address + count > ADDRESS_SPACE:
+            return ExcCodes.ILLEGAL_ADDRESS
+        registers = [0] * count
+        t = time.monotonic() - self.started
+        for channel in self.channels:
+            if channel.end <= address or channel.address >= address + count:
+                continue
+            words = channel.encode(self.waveform(channel).value(t, self.rng))
+            for index, word in enumerate(words):
+                position = channel.address + index - address
+                if 0 <= position < count:
+                    registers[position] = word
+        return registers
+
+    def setValues(self, func_code, address, values):
+        return ExcCodes.ILLEGAL_FUNCTION
+
+
+class ModbusSimulator:
+    """Сервер Modbus TCP с набором имитируемых контроллеров: unit id -> SimulatedDevice"""
+
+    def __init__(self, devices, host="127.0.0.1", port=5020):
+        self.devices = dict(devices)
+        self.host = host
+        self.port = port
+        for device in self.devices.values():
+            device.simulator = self
+        self.server = None
+
+    async def start(self):
+        """Начинает принимать соединения; при port=0 порт выбирается системой"""
+        context = ModbusServerContext(devices=self.devices, single=False)
+        self.server = ModbusTcpServer(context, address=(self.host, self.port))
+        await self.server.serve_forever(background=True)
+        self.port = self.server.transport.sockets[0].getsockname()[1]
+        logger.info(f"🧪 Имитатор Modbus слушает {self.host}:{self.port}, устройств: {len(self.devices)}")
+
+    def drop_connections(self):
+        """Закрывает все клиентские соединения"""
+        for connection in list(self.server.active_connections.values()):
+            connection.close()
+
+    async def stop(self):
+        if self.server is not None:
+            await self.server.shutdown()
+            self.server = None
+
+
+def default_waveforms():
+    """Сигналы для карты Z037: суточные колебания подачи СО и воздуха в котельной"""
+    return {
+        "tpod_so": Waveform("sine", mean=40.0, amplitude=12.0, period=24 * 60 * 60, noise=0.2),
+        "tvozd_kotel": Waveform("sine", mean=18.0, amplitude=3.0, period=24 * 60 * 60, phase=0.25, noise=0.1),
+    }
+
+
+async def _serve(args):
+    faults = FaultProfile(args.latency, args.jitter, args.error_rate, args.disconnect_rate)
+    device = SimulatedDevice(REGISTER_MAP, default_waveforms(), faults, seed=args.seed)
+    simulator = ModbusSimulator({args.unit: device}, args.host, args.port)
+    await simulator.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Имитатор контроллера Z037 по Modbus TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--unit", type=int, default=247)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов-исключений")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="доля запросов, обрывающих соединение")
+    parser.add_argument("--seed", type=int, default=None)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
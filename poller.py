@@ -0,0 +1,43 @@
+"""Асинхронный опрос контроллера по карте регистров"""
+from colorama import Fore
+from loguru import logger
+
+from metrics import MODBUS_READ_ERRORS
+from register_map import plan_block_reads
+
+
+class ModbusPoller:
+    """Читает все каналы карты регистров минимальным числом блочных запросов"""
+
+    def __init__(self, channels, unit_id, name=None):
+        self.unit_id = unit_id
+        self.blocks = plan_block_reads(channels)
+        self._error_responses = MODBUS_READ_ERRORS.labels(name or f"unit {unit_id}", "response")
+
+    async def poll(self, connection, timeout=None):
+        """Выполняет один цикл чтения через connection; возвращает {имя канала: значение} или None без связи.
+
+        timeout - сколько ждать ответа на каждый запрос, сек (по умолчанию - таймаут соединения).
+        """
+        if not await connection.ensure_connected():
+            return None
+
+        values = {}
+        for block in self.blocks:
+            result = await connection.read_holding_registers(address=block.address, count=block.count,
+                                                             device_id=self.unit_id, timeout=timeout)
+            block_names = ", ".join(channel.title for channel in block.channels)
+            last_address = block.address + block.count - 1
+
+            # Проверяем результат на ошибку
+            if hasattr(result, 'isError') and result.isError():
+                self._error_responses.inc()
+                print(Fore.RED + f"[unit {self.unit_id}] Ошибка чтения регистров {block.address}-{last_address} ({block_names}): {result}")
+                logger.error(f"❌ Modbus [unit {self.unit_id}]: ошибка чтения регистров {block.address}-{last_address} ({block_names}): {result}")
+            elif not hasattr(result, 'registers'):
+                self._error_responses.inc()
+                print(Fore.RED + f"[unit {self.unit_id}] Ошибка: некорректный ответ от контроллера ({block_names})")
+                logger.error(f"❌ Modbus [unit {self.unit_id}]: некорректный ответ, нет атрибута registers ({block_names})")
+            else:
+                values.update(block.decode(result.registers))
+        return values
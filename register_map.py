@@ -0,0 +1,116 @@
+"""Декларативная карта регистров Modbus и планирование блочного чтения"""
+from dataclasses import dataclass, field
+import struct
+
+# Поддерживаемые типы данных: формат struct и количество 16-битных регистров
+DATA_TYPES = {
+    "int16": ("h", 1),
+    "uint16": ("H", 1),
+    "int32": ("i", 2),
+    "uint32": ("I", 2),
+    "float32": ("f", 2),
+    "float64": ("d", 4),
+}
+
+# Порядок слов: "big" - старшее слово первым (как у Z037), "little" - младшее первым
+WORD_ORDERS = ("big", "little")
+
+# Максимальное количество регистров в одном запросе Read Holding Registers (спецификация Modbus)
+MAX_REGISTERS_PER_READ = 125
+
+
+@dataclass(frozen=True)
+class RegisterChannel:
+    """Описание одного канала: адрес, тип данных, порядок слов и масштабирование"""
+    name: str
+    title: str
+    address: int
+    data_type: str = "float32"
+    word_order: str = "big"
+    scale: float = 1.0
+    offset: float = 0.0
+
+    def __post_init__(self):
+        if self.data_type not in DATA_TYPES:
+            raise ValueError(f"Неизвестный тип данных '{self.data_type}' для канала {self.name}")
+        if self.word_order not in WORD_ORDERS:
+            raise ValueError(f"Неизвестный порядок слов '{self.word_order}' для канала {self.name}")
+        if self.address < 0:
+            raise ValueError(f"Отрицательный адрес регистра для канала {self.name}")
+
+    @property
+    def count(self):
+        """Количество регистров, занимаемых каналом"""
+        return DATA_TYPES[self.data_type][1]
+
+    @property
+    def end(self):
+        """Адрес, следующий за последним регистром канала"""
+        return self.address + self.count
+
+    def decode(self, registers):
+        """Преобразует регистры канала в значение с учетом порядка слов и масштаба"""
+        words = list(registers)
+        if self.word_order == "little":
+            words.reverse()
+        raw_bytes = struct.pack(f">{len(words)}H", *words)
+        value = struct.unpack(">" + DATA_TYPES[self.data_type][0], raw_bytes)[0]
+        return value * self.scale + self.offset
+
+    def encode(self, value):
+        """Обратное преобразование: значение канала в регистры (для имитатора контроллера)"""
+        fmt = DATA_TYPES[self.data_type][0]
+        raw = (value - self.offset) / self.scale
+        if fmt not in ("f", "d"):
+            raw = int(round(raw))
+        words = list(struct.unpack(f">{self.count}H", struct.pack(">" + fmt, raw)))
+        if self.word_order == "little":
+            words.reverse()
+        return words
+
+
+@dataclass
+class ReadBlock:
+    """Непрерывный диапазон регистров, читаемый одним запросом"""
+    address: int
+    count: int
+    channels: list = field(default_factory=list)
+
+    def decode(self, registers):
+        """Декодирует все каналы блока из одного ответа контроллера"""
+        if len(registers) < self.count:
+            raise ValueError(f"Ответ короче блока: {len(registers)} < {self.count} (адрес {self.address})")
+        values = {}
+        for channel in self.channels:
+            start = channel.address - self.address
+            values[channel.name] = channel.decode(registers[start:start + channel.count])
+        return values
+
+
+def plan_block_reads(channels, max_gap=0, max_count=MAX_REGISTERS_PER_READ):
+    """Строит минимальный набор непрерывных блоков для чтения всех каналов.
+
+    Соседние каналы объединяются в один блок, если разрыв между ними не больше
+    max_gap регистров и длина блока не превышает max_count.
+    """
+    blocks = []
+    for channel in sorted(channels, key=lambda ch: ch.address):
+        if channel.count > max_count:
+            raise ValueError(f"Канал {channel.name} не помещается в один запрос ({channel.count} > {max_count})")
+        current = blocks[-1] if blocks else None
+        if current is not None:
+            block_end = current.address + current.count
+            new_end = max(block_end, channel.end)
+            if channel.address - block_end <= max_gap and new_end - current.address <= max_count:
+                current.count = new_end - current.address
+                current.channels.append(channel)
+                continue
+        blocks.append(ReadBlock(address=channel.address, count=channel.count, channels=[channel]))
+    return blocks
+
+
+# Карта регистров контроллера Z037
+REGISTER_MAP = [
+    RegisterChannel(name="tpod_so", title="Температура подачи СО", address=5),  # Температура подачи системы отопления
+    RegisterChannel(name="tvozd_kotel", title="Температура воздуха в котельной", address=7),  # Температура воздуха в котельной
+]
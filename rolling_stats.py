@@ -0,0 +1,275 @@
+"""Скользящая статистика за несколько окон с обновлением за O(1) на измерение"""
+from array import array
+from collections import deque, namedtuple
+import math
+import time
+
+import numpy as np
+
+# Окна по умолчанию: название -> длительность в секундах
+DEFAULT_WINDOWS = {"5m": 300, "1h": 3600, "24h": 86400}
+
+# Вес измерения ограничен этим числом периодов опроса: значение после обрыва связи не растягивается на весь простой
+MAX_GAP_PERIODS = 3
+
+# Статистика окна на момент запроса; coverage - сколько секунд окна покрыто измерениями
+WindowStats = namedtuple("WindowStats", ["count", "mean", "min", "max", "variance", "coverage"])
+
+
+class SampleRing:
+    """Кольцевой буфер измерений на массивах array('d'): одна копия сырых данных на канал.
+
+    Каждому измерению присваивается возрастающий порядковый номер (seq), по которому
+    окна обращаются к значениям, не копируя их. Вес измерения - интервал в секундах,
+    который оно представляет.
+    """
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("Емкость буфера должна быть положительной")
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.weights = array("d", bytes(8 * capacity))
+        self.next_seq = 0
+
+    def __len__(self):
+        return min(self.next_seq, self.capacity)
+
+    @property
+    def oldest_seq(self):
+        """Номер самого старого измерения, еще хранящегося в буфере"""
+        return max(0, self.next_seq - self.capacity)
+
+    def append(self, timestamp, value, weight=1.0):
+        """Добавляет измерение, перезаписывая самое старое; возвращает его номер"""
+        seq = self.next_seq
+        index = seq % self.capacity
+        self.times[index] = timestamp
+        self.values[index] = value
+        self.weights[index] = weight
+        self.next_seq = seq + 1
+        return seq
+
+    def time(self, seq):
+        return self.times[seq % self.capacity]
+
+    def value(self, seq):
+        return self.values[seq % self.capacity]
+
+    def weight(self, seq):
+        return self.weights[seq % self.capacity]
+
+
+class RollingWindow:
+    """Окно фиксированной длительности поверх общего SampleRing.
+
+    Среднее и дисперсия взвешены по времени и поддерживаются взвешенными формулами
+    Уэлфорда с добавлением и удалением, минимум и максимум - монотонными очередями
+    номеров измерений.
+    """
+
+    def __init__(self, ring, duration):
+        self.ring = ring
+        self.duration = duration
+        self.first_seq = 0
+        self.count = 0
+        self.weight = 0.0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._min_seqs = deque()
+        self._max_seqs = deque()
+
+    def add(self, seq):
+        """Учитывает измерение, только что добавленное в буфер"""
+        value = self.ring.value(seq)
+        weight = self.ring.weight(seq)
+        if self.count == 0:
+            self.first_seq = seq
+        self.count += 1
+        self.weight += weight
+        delta = value - self.mean
+        self.mean += delta * weight / self.weight
+        self._m2 += weight * delta * (value - self.mean)
+
+        while self._min_seqs and self.ring.value(self._min_seqs[-1]) >= value:
+            self._min_seqs.pop()
+        self._min_seqs.append(seq)
+        while self._max_seqs and self.ring.value(self._max_seqs[-1]) <= value:
+            self._max_seqs.pop()
+        self._max_seqs.append(seq)
+
+        self.expire(self.ring.time(seq))
+
+    def expire(self, now):
+        """Удаляет из окна измерения старше now - duration"""
+        horizon = now - self.duration
+        while self.count and self.ring.time(self.first_seq) <= horizon:
+            self._remove_first()
+
+    def rebuild(self, times, values, weights):
+        """Пересчитывает окно по всему содержимому буфера (массивы NumPy, номер измерения - индекс).
+
+        Результат тот же, что после добавления этих измерений по одному через add(),
+        но за один векторный проход - для восстановления истории при запуске.
+        """
+        first = int(np.searchsorted(times, times[-1] - self.duration, side="right")) if len(times) else 0
+        values, weights = values[first:], weights[first:]
+        self.first_seq = first
+        self.count = len(values)
+        self._min_seqs = deque()
+        self._max_seqs = deque()
+        if not self.count:
+            self.weight = self.mean = self._m2 = 0.0
+            return
+        self.weight = float(weights.sum())
+        self.mean = float(np.dot(weights, values) / self.weight)
+        self._m2 = float(np.dot(weights, (values - self.mean) ** 2))
+        # В очередях остаются измерения строго меньше (больше) всех последующих, как после add()
+        later_min = np.append(np.minimum.accumulate(values[::-1])[::-1][1:], np.inf)
+        later_max = np.append(np.maximum.accumulate(values[::-1])[::-1][1:], -np.inf)
+        seqs = np.arange(first, first + self.count)
+        self._min_seqs.extend(seqs[values < later_min].tolist())
+        self._max_seqs.extend(seqs[values > later_max].tolist())
+
+    def evict(self, before_seq):
+        """Удаляет из окна измерения с номером меньше before_seq, пока их ячейки буфера не перезаписаны"""
+        while self.count and self.first_seq < before_seq:
+            self._remove_first()
+
+    def _remove_first(self):
+        seq = self.first_seq
+        value = self.ring.value(seq)
+        weight = self.ring.weight(seq)
+        self.count -= 1
+        self.first_seq = seq + 1
+        if self.count == 0:
+            self.weight = 0.0
+            self.mean = 0.0
+            self._m2 = 0.0
+        else:
+            self.weight -= weight
+            delta = value - self.mean
+            self.mean -= delta * weight / self.weight
+            self._m2 -= weight * delta * (value - self.mean)
+        if self._min_seqs and self._min_seqs[0] == seq:
+            self._min_seqs.popleft()
+        if self._max_seqs and self._max_seqs[0] == seq:
+            self._max_seqs.popleft()
+
+    @property
+    def first_time(self):
+        """Время самого старого измерения в окне"""
+        return self.ring.time(self.first_seq) if self.count else None
+
+    @property
+    def first_value(self):
+        return self.ring.value(self.first_seq) if self.count else None
+
+    @property
+    def min(self):
+        return self.ring.value(self._min_seqs[0]) if self.count else None
+
+    @property
+    def max(self):
+        return self.ring.value(self._max_seqs[0]) if self.count else None
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return 0.0 if self.count else None
+        return max(0.0, self._m2 / self.weight)
+
+    @property
+    def stddev(self):
+        variance = self.variance
+        return math.sqrt(variance) if variance is not None else None
+
+    def stats(self):
+        """Возвращает WindowStats (для пустого окна все значения, кроме count, равны None)"""
+        if not self.count:
+            return WindowStats(0, None, None, None, None, 0.0)
+        return WindowStats(self.count, self.mean, self.min, self.max, self.variance, self.weight)
+
+
+class ChannelHistory:
+    """История одного канала: общий кольцевой буфер и несколько одновременных окон.
+
+    Вес измерения - интервал от предыдущего измерения (не больше max_gap), поэтому
+    пропущенные циклы опроса не смещают среднее в сторону оставшихся измерений.
+    """
+
+    def __init__(self, windows=None, sample_period=10, max_gap=None):
+        self.windows_config = dict(windows or DEFAULT_WINDOWS)
+        self.sample_period = sample_period
+        self.max_gap = max_gap or sample_period * MAX_GAP_PERIODS
+        longest = max(self.windows_config.values())
+        # Запас 10% на неточность периода опроса
+        capacity = int(math.ceil(longest / sample_period * 1.1)) + 1
+        self.ring = SampleRing(capacity)
+        self.windows = {name: RollingWindow(self.ring, duration) for name, duration in self.windows_config.items()}
+        self.last = None
+        self.last_time = None
+
+    def __len__(self):
+        return len(self.ring)
+
+    def append(self, value, timestamp=None):
+        """Добавляет измерение и обновляет все окна"""
+        timestamp = time.time() if timestamp is None else timestamp
+        if self.last_time is None:
+            weight = self.sample_period
+        else:
+            # Небольшой минимальный вес, чтобы окно из измерений с одинаковым временем не имело нулевого веса
+            weight = min(max(timestamp - self.last_time, 1e-3), self.max_gap)
+        if self.ring.next_seq >= self.ring.capacity:
+            # Ячейка самого старого измерения сейчас будет перезаписана: окна должны вычесть
+            # его значение и вес до этого, иначе они вычтут уже новое измерение
+            evicted = self.ring.next_seq - self.ring.capacity + 1
+            for window in self.windows.values():
+                window.evict(evicted)
+        seq = self.ring.append(timestamp, value, weight)
+        for window in self.windows.values():
+            window.add(seq)
+        self.last = value
+        self.last_time = timestamp
+
+    def load(self, times, values):
+        """Заполняет пустую историю измерениями (массивы времени по возрастанию и значений) за один проход.
+
+        Веса считаются так же, как в append(); в буфер попадают только последние capacity измерений.
+        """
+        if self.ring.next_seq:
+            raise ValueError("История канала уже содержит измерения")
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        if not len(times):
+            return
+        weights = np.empty_like(times)
+        weights[0] = self.sample_period
+        weights[1:] = np.clip(np.diff(times), 1e-3, self.max_gap)
+        times, values, weights = (column[-self.ring.capacity:] for column in (times, values, weights))
+        count = len(times)
+        self.ring.times[:count] = array("d", times.tobytes())
+        self.ring.values[:count] = array("d", values.tobytes())
+        self.ring.weights[:count] = array("d", weights.tobytes())
+        self.ring.next_seq = count
+        for window in self.windows.values():
+            window.rebuild(times, values, weights)
+        self.last = float(values[-1])
+        self.last_time = float(times[-1])
+
+    def expire(self, now):
+        """Удаляет из всех окон измерения старше их длительности на момент now.
+
+        Окна сдвигаются при добавлении измерений; если канал перестал их получать,
+        статистику перед чтением нужно сдвинуть до текущего времени.
+        """
+        for window in self.windows.values():
+            window.expire(now)
+
+    def window(self, name):
+        return self.windows[name]
+
+    def stats(self, name):
+        return self.windows[name].stats()
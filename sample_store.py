@@ -0,0 +1,146 @@
+"""Хранилище измерений на SQLite (WAL) с пакетной записью и прореженными уровнями"""
+import sqlite3
+import threading
+import time
+
+from loguru import logger
+
+# Уровни прореживания: название -> размер интервала в секундах
+TIERS = {"1m": 60, "1h": 60 * 60}
+
+# Сроки хранения по умолчанию, сек: сырые измерения - 8 суток, минутные - 90 суток, часовые - 5 лет
+DEFAULT_RETENTION = {
+    "raw": 8 * 24 * 60 * 60,
+    "1m": 90 * 24 * 60 * 60,
+    "1h": 5 * 365 * 24 * 60 * 60,
+}
+
+# Как часто удалять устаревшие данные, сек
+PRUNE_INTERVAL = 60 * 60
+
+
+class SampleStore:
+    """Журнал измерений: сырые значения и агрегаты (count, sum, min, max) по минутам и часам.
+
+    Измерения копятся в памяти и записываются пачкой одной транзакцией в flush().
+    Метод add() вызывается из цикла событий, flush() можно выполнять в отдельном потоке.
+    """
+
+    def __init__(self, path, retention=None):
+        self.path = path
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.pending = []
+        self.last_prune = 0.0
+        self._lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                "channel TEXT NOT NULL, ts REAL NOT NULL, value REAL NOT NULL, "
+                "PRIMARY KEY (channel, ts)) WITHOUT ROWID"
+            )
+            # Ключ начинается с канала, поэтому удаление устаревших данных по времени без
+            # отдельного индекса просматривало бы всю таблицу под блокировкой записи
+            self._db.execute("CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts)")
+            for tier in TIERS:
+                self._db.execute(
+                    f"CREATE TABLE IF NOT EXISTS samples_{tier} ("
+                    "channel TEXT NOT NULL, bucket INTEGER NOT NULL, count INTEGER NOT NULL, "
+                    "sum REAL NOT NULL, min REAL NOT NULL, max REAL NOT NULL, "
+                    "PRIMARY KEY (channel, bucket)) WITHOUT ROWID"
+                )
+                self._db.execute(f"CREATE INDEX IF NOT EXISTS samples_{tier}_bucket ON samples_{tier} (bucket)")
+
+    def add(self, channel, timestamp, value):
+        """Ставит измерение в очередь на запись"""
+        with self._pending_lock:
+            self.pending.append((channel, timestamp, value))
+
+    def flush(self):
+        """Записывает накопленные измерения одной транзакцией; возвращает число записанных"""
+        with self._pending_lock:
+            batch, self.pending = self.pending, []
+        if not batch:
+            return 0
+
+        with self._lock, self._db:
+            # Повторное измерение (тот же канал и время) не записывается и не попадает в агрегаты,
+            # иначе уровни посчитали бы его дважды
+            inserted = [
+                sample for sample in batch
+                if self._db.execute("INSERT OR IGNORE INTO samples (channel, ts, value) VALUES (?, ?, ?)", sample).rowcount
+            ]
+            # Агрегаты сначала сворачиваются в памяти, чтобы на интервал приходился один UPSERT
+            aggregates = {tier: {} for tier in TIERS}
+            for channel, timestamp, value in inserted:
+                for tier, size in TIERS.items():
+                    key = (channel, int(timestamp // size * size))
+                    current = aggregates[tier].get(key)
+                    if current is None:
+                        aggregates[tier][key] = [1, value, value, value]
+                    else:
+                        current[0] += 1
+                        current[1] += value
+                        current[2] = min(current[2], value)
+                        current[3] = max(current[3], value)
+            for tier, buckets in aggregates.items():
+                self._db.executemany(
+                    f"INSERT INTO samples_{tier} (channel, bucket, count, sum, min, max) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (channel, bucket) DO UPDATE SET "
+                    "count = count + excluded.count, sum = sum + excluded.sum, "
+                    "min = MIN(min, excluded.min), max = MAX(max, excluded.max)",
+                    [(channel, bucket, *values) for (channel, bucket), values in buckets.items()],
+                )
+
+        if time.time() - self.last_prune >= PRUNE_INTERVAL:
+            self.prune()
+        return len(inserted)
+
+    def prune(self, now=None):
+        """Удаляет данные старше срока хранения каждого уровня"""
+        now = time.time() if now is None else now
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM samples WHERE ts < ?", (now - self.retention["raw"],))
+            for tier in TIERS:
+                self._db.execute(f"DELETE FROM samples_{tier} WHERE bucket < ?", (now - self.retention[tier],))
+        self.last_prune = now
+        logger.debug("🧹 Хранилище: устаревшие измерения удалены")
+
+    def load_recent(self, channel, since):
+        """Возвращает сырые измерения канала начиная с момента since, упорядоченные по времени"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT ts, value FROM samples WHERE channel = ? AND ts >= ? ORDER BY ts", (channel, since)
+            ).fetchall()
+
+    def load_range(self, channel, since, until):
+        """Возвращает сырые измерения канала за [since, until), упорядоченные по времени"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT ts, value FROM samples WHERE channel = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (channel, since, until),
+            ).fetchall()
+
+    def query_buckets(self, channel, tier, since, until=None):
+        """Возвращает агрегаты (bucket, count, sum, min, max) уровня tier за период"""
+        if tier not in TIERS:
+            raise ValueError(f"Неизвестный уровень прореживания '{tier}'")
+        until = time.time() if until is None else until
+        with self._lock:
+            return self._db.execute(
+                f"SELECT bucket, count, sum, min, max FROM samples_{tier} "
+                "WHERE channel = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                (channel, int(since // TIERS[tier] * TIERS[tier]), until),
+            ).fetchall()
+
+    def close(self):
+        """Записывает остаток очереди и закрывает базу"""
+        self.flush()
+        with self._lock:
+            self._db.close()
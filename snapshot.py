@@ -0,0 +1,118 @@
+"""Неизменяемые версионные снимки состояния парка и кэш отчетов по ним"""
+from collections import OrderedDict, namedtuple
+import itertools
+from types import MappingProxyType
+import time
+
+from modbus_connection import STATE_CONNECTED
+
+# Сколько готовых текстов отчетов держать в памяти
+REPORT_CACHE_SIZE = 256
+
+# Версии снимков устройств: общий счетчик процесса, чтобы версии разных планировщиков не совпадали
+_device_versions = itertools.count(1)
+
+# Снимок канала: последнее значение и статистика всех окон (окно -> WindowStats)
+ChannelSnapshot = namedtuple("ChannelSnapshot", ["name", "title", "last", "last_time", "stats"])
+
+
+class DeviceSnapshot(namedtuple("DeviceSnapshot", [
+    "name", "title", "poll_interval", "channels", "connected", "reconnect_count", "last_error", "missed_cycles",
+    "failures", "last_success", "timestamp", "version",
+])):
+    """Снимок устройства на конец цикла опроса.
+
+    connected - и шлюз на связи, и последний опрос самого устройства успешен; failures -
+    неудачные опросы устройства подряд; timestamp - время снимка; version - номер снимка,
+    уникальный в пределах процесса.
+    """
+    __slots__ = ()
+
+    def key(self, channel_name):
+        return f"{self.name}/{channel_name}"
+
+    @property
+    def sample_age(self):
+        """Сколько секунд прошло от последнего измерения до снимка (None - измерений нет)"""
+        times = [channel.last_time for channel in self.channels if channel.last_time is not None]
+        return self.timestamp - max(times) if times else None
+
+
+# Снимок парка: номер версии, время публикации и устройства (имя -> DeviceSnapshot)
+FleetSnapshot = namedtuple("FleetSnapshot", ["version", "timestamp", "devices"])
+
+
+def snapshot_device(device, connection_status, now=None):
+    """Собирает снимок устройства из истории каналов (статистика окон готова за O(1)).
+
+    Шлюз может быть на связи, когда само устройство за ним не отвечает, поэтому состояние
+    связи учитывает и сокет шлюза, и результат последних опросов устройства.
+    """
+    now = time.time() if now is None else now
+    gateway_connected = connection_status["state"] == STATE_CONNECTED
+    if device.consecutive_failures:
+        last_error = device.last_error
+    else:
+        last_error = None if gateway_connected else connection_status["last_error"]
+    channels = []
+    for channel in device.channels:
+        history = device.histories[channel.name]
+        # Без новых измерений окна не сдвигаются сами: старые данные не должны выглядеть текущими
+        history.expire(now)
+        stats = MappingProxyType({name: window.stats() for name, window in history.windows.items()})
+        channels.append(ChannelSnapshot(channel.name, channel.title, history.last, history.last_time, stats))
+    return DeviceSnapshot(
+        device.name, device.title, device.poll_interval, tuple(channels),
+        gateway_connected and not device.consecutive_failures, connection_status["reconnect_count"],
+        last_error, device.missed_cycles, device.consecutive_failures, device.last_success, now,
+        next(_device_versions),
+    )
+
+
+class SnapshotPublisher:
+    """Хранит текущий снимок парка.
+
+    Публикация заменяет ссылку на новый неизменяемый снимок, поэтому читатели берут
+    self.current без блокировок и всегда видят согласованное состояние.
+    """
+
+    def __init__(self):
+        self.current = FleetSnapshot(0, time.time(), MappingProxyType({}))
+
+    def publish(self, device_snapshot):
+        devices = dict(self.current.devices)
+        devices[device_snapshot.name] = device_snapshot
+        self.current = FleetSnapshot(self.current.version + 1, time.time(), MappingProxyType(devices))
+        return self.current
+
+
+class ReportCache:
+    """Готовые тексты отчетов с вытеснением LRU.
+
+    Текст привязан к версиям снимков устройств, попавших в отчет: снимок парка меняется
+    после цикла любого устройства, а отчет по одному устройству - только после его цикла.
+    """
+
+    def __init__(self, max_size=REPORT_CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, snapshot, names, key, render):
+        """Возвращает текст по ключу для снимков устройств names, вызывая render(snapshot) только при промахе"""
+        versions = tuple(
+            snapshot.devices[name].version if name in snapshot.devices else None for name in names
+        )
+        cached = self._items.get(key)
+        if cached is not None and cached[0] == versions:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        text = render(snapshot)
+        self._items[key] = (versions, text)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return text
@@ -0,0 +1,108 @@
+"""Подписчики на отчеты и оповещения с фильтрами по каналам и типам оповещений"""
+from dataclasses import asdict, dataclass
+import json
+import os
+
+from loguru import logger
+
+
+@dataclass
+class Subscription:
+    """Подписка чата. channels - имена каналов, устройств или "устройство/канал";
+    alert_types - типы (threshold, rate, stale, deviation) или имена правил; None - без фильтра.
+    """
+    chat_id: str
+    channels: list = None
+    alert_types: list = None
+
+    def wants_channel(self, device, channel_name):
+        if self.channels is None:
+            return True
+        return channel_name in self.channels or device.name in self.channels or \
+            device.key(channel_name) in self.channels
+
+    def wants_alert(self, event):
+        if self.alert_types is not None and event.rule.kind not in self.alert_types \
+                and event.rule.name not in self.alert_types:
+            return False
+        return any(self.wants_channel(event.device, channel) for channel in event.rule.channels)
+
+    @property
+    def audience(self):
+        """Ключ аудитории: подписчики с одинаковым фильтром каналов получают один и тот же отчет"""
+        return None if self.channels is None else tuple(sorted(self.channels))
+
+    def describe(self):
+        channels = ", ".join(self.channels) if self.channels else "все"
+        alert_types = ", ".join(self.alert_types) if self.alert_types else "все"
+        return f"каналы: {channels}; оповещения: {alert_types}"
+
+
+class SubscriberRegistry:
+    """Реестр подписок в JSON-файле; чат из TELEGRAM_CHAT_ID получает все сообщения без подписки"""
+
+    def __init__(self, path, default_chat_id=None):
+        self.path = path
+        self.default_chat_id = str(default_chat_id) if default_chat_id else None
+        self._subscriptions = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as registry_file:
+                raw = json.load(registry_file)
+            for item in raw.get("subscribers", []):
+                subscription = Subscription(**item)
+                self._subscriptions[subscription.chat_id] = subscription
+            logger.info(f"👥 Загружено подписчиков: {len(self._subscriptions)}")
+        except (OSError, ValueError, TypeError) as error:
+            logger.error(f"❌ Не удалось прочитать реестр подписчиков {self.path}: {error}")
+
+    def _save(self):
+        # Запись через временный файл, чтобы сбой не оставил реестр наполовину записанным
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as registry_file:
+            json.dump({"subscribers": [asdict(item) for item in self._subscriptions.values()]},
+                      registry_file, ensure_ascii=False, indent=2)
+        os.replace(temporary_path, self.path)
+
+    def __len__(self):
+        return len(self.subscriptions())
+
+    def get(self, chat_id):
+        return self._subscriptions.get(str(chat_id))
+
+    def subscribe(self, chat_id, channels=None, alert_types=None):
+        """Создает или заменяет подписку чата"""
+        subscription = Subscription(str(chat_id), channels or None, alert_types or None)
+        self._subscriptions[subscription.chat_id] = subscription
+        self._save()
+        return subscription
+
+    def unsubscribe(self, chat_id):
+        """Удаляет подписку; возвращает False, если ее не было"""
+        if self._subscriptions.pop(str(chat_id), None) is None:
+            return False
+        self._save()
+        return True
+
+    def subscriptions(self):
+        """Все действующие подписки, включая чат по умолчанию"""
+        subscriptions = list(self._subscriptions.values())
+        if self.default_chat_id and self.default_chat_id not in self._subscriptions:
+            subscriptions.append(Subscription(self.default_chat_id))
+        return subscriptions
+
+    def alert_recipients(self, event):
+        """Чаты, которым нужно оповещение event"""
+        return [item.chat_id for item in self.subscriptions() if item.wants_alert(event)]
+
+    def report_audiences(self):
+        """Группирует подписки по фильтру каналов: {ключ аудитории: (подписка-образец, [чаты])}"""
+        audiences = {}
+        for item in self.subscriptions():
+            _, chats = audiences.setdefault(item.audience, (item, []))
+            chats.append(item.chat_id)
+        return audiences
@@ -0,0 +1,229 @@
+"""Неблокирующая очередь исходящих сообщений Telegram с ограничением частоты и повторами"""
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+import time
+
+from loguru import logger
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter
+
+from metrics import TELEGRAM_MESSAGES_QUEUED, TELEGRAM_QUEUE_PENDING, TELEGRAM_SEND_SECONDS
+
+# Ограничения Telegram: ~30 сообщений в секунду на бота, 1 в секунду в личный чат, 20 в минуту в группу
+GLOBAL_RATE = 25.0
+PRIVATE_CHAT_INTERVAL = 1.0
+GROUP_CHAT_INTERVAL = 3.0
+
+# Размер очереди и параметры повторов
+DEFAULT_MAX_QUEUE = 1000
+# Обработчики отправляют сообщения разным чатам параллельно (рассылка подписчикам)
+DEFAULT_WORKERS = 8
+MAX_ATTEMPTS = 6
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+
+@dataclass
+class OutboundMessage:
+    """Сообщение в очереди на отправку"""
+    chat_id: object
+    text: str
+    coalesce_key: str = None
+    attempts: int = 0
+    sending: bool = False
+    created: float = field(default_factory=time.monotonic)
+
+
+class TokenBucket:
+    """Ограничитель общей частоты отправки"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def pause(self, seconds):
+        """Останавливает выдачу на seconds секунд; после паузы частота набирается заново"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class TelegramOutbox:
+    """Очередь исходящих сообщений: send() не ждет Telegram и никогда не блокирует опрос.
+
+    Сообщения одного чата отправляются строго по порядку и не чаще лимита чата.
+    Сообщение с тем же coalesce_key, еще ожидающее отправки, заменяется новым текстом.
+    При 429 пауза retry_after выдерживается всеми обработчиками (лимит Telegram общий на бота),
+    при сетевых ошибках и 5xx - экспоненциальная задержка для чата.
+    """
+
+    def __init__(self, max_queue=DEFAULT_MAX_QUEUE, workers=DEFAULT_WORKERS, global_rate=GLOBAL_RATE):
+        self.bot = None
+        self.max_queue = max_queue
+        self.workers = workers
+        self.bucket = TokenBucket(global_rate)
+        self._chats = {}
+        self._next_allowed = {}
+        # Чаты, стоящие в очереди готовых или обрабатываемые прямо сейчас (не больше одного обработчика на чат)
+        self._scheduled = set()
+        self._ready = None
+        self._tasks = []
+        self.pending = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.retries = 0
+
+    def start(self, bot):
+        """Запускает обработчики очереди в текущем цикле событий"""
+        self.bot = bot
+        self._ready = asyncio.Queue()
+        TELEGRAM_QUEUE_PENDING.set_function(lambda: self.pending)
+        # Сообщения, поставленные до запуска, ждут в своих чатах
+        for chat_id in self._chats:
+            self._schedule(chat_id)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"telegram_outbox_{i}") for i in range(self.workers)]
+
+    async def stop(self, timeout=5.0):
+        """Дает очереди время на отправку остатка и останавливает обработчики"""
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.pending:
+            logger.warning(f"⚠️ Очередь Telegram: не отправлено сообщений при остановке: {self.pending}")
+
+    def send(self, chat_id, text, coalesce_key=None, cancel_key=None):
+        """Ставит сообщение в очередь; возвращает False, если очередь переполнена.
+
+        Если в очереди чата еще ждет сообщение с ключом cancel_key (например, оповещение,
+        на которое пришел возврат к норме), отбрасываются оба: получатель не увидит
+        ни событие, ни его отмену, и итоговое состояние останется верным.
+        """
+        if cancel_key is not None:
+            messages = self._chats.get(chat_id, ())
+            for index, message in enumerate(messages):
+                if message.coalesce_key == cancel_key and not message.sending:
+                    del messages[index]
+                    self.pending -= 1
+                    self.cancelled += 1
+                    return True
+
+        if coalesce_key is not None:
+            for message in self._chats.get(chat_id, ()):
+                if message.coalesce_key == coalesce_key and not message.sending:
+                    # Более новое сообщение заменяет устаревшее, место в очереди сохраняется
+                    message.text = text
+                    self.coalesced += 1
+                    return True
+
+        if self.pending >= self.max_queue:
+            self.dropped += 1
+            logger.error(f"❌ Очередь Telegram переполнена ({self.max_queue}), сообщение для {chat_id} отброшено")
+            return False
+
+        self._chats.setdefault(chat_id, deque()).append(OutboundMessage(chat_id, text, coalesce_key))
+        self.pending += 1
+        TELEGRAM_MESSAGES_QUEUED.inc()
+        self._schedule(chat_id)
+        return True
+
+    def broadcast(self, chat_ids, text, coalesce_key=None, cancel_key=None):
+        """Ставит одно сообщение в очередь нескольким чатам; возвращает число поставленных"""
+        return sum(self.send(chat_id, text, coalesce_key, cancel_key) for chat_id in chat_ids)
+
+    def _schedule(self, chat_id):
+        """Ставит чат в очередь готовых не раньше, чем позволяет его лимит"""
+        if self._ready is None or chat_id in self._scheduled:
+            return
+        self._scheduled.add(chat_id)
+        delay = self._next_allowed.get(chat_id, 0.0) - time.monotonic()
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    @staticmethod
+    def _chat_interval(chat_id):
+        # У групп и каналов отрицательные идентификаторы
+        return GROUP_CHAT_INTERVAL if str(chat_id).startswith("-") else PRIVATE_CHAT_INTERVAL
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            messages = self._chats.get(chat_id)
+            if not messages:
+                self._scheduled.discard(chat_id)
+                continue
+            message = messages[0]
+            await self.bucket.acquire()
+
+            delay = self._chat_interval(chat_id)
+            message.sending = True
+            started = time.perf_counter()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=message.text)
+                messages.popleft()
+                self.pending -= 1
+                self.sent += 1
+            except RetryAfter as error:
+                retry_after = getattr(error.retry_after, "total_seconds", lambda: error.retry_after)()
+                delay = max(delay, float(retry_after))
+                # Остальные обработчики тоже ждут: иначе они продолжат упираться в тот же лимит
+                self.bucket.pause(float(retry_after))
+                message.attempts += 1
+                self.retries += 1
+                logger.warning(f"⚠️ Telegram: лимит частоты для {chat_id}, отправка приостановлена на {delay:.0f} сек")
+            except (Forbidden, BadRequest, ChatMigrated) as error:
+                # Повтор не поможет: бот заблокирован, чат не найден или сообщение некорректно
+                messages.popleft()
+                self.pending -= 1
+                self.dropped += 1
+                logger.error(f"❌ Telegram: сообщение для {chat_id} отброшено: {error}")
+            except (NetworkError, OSError) as error:
+                message.attempts += 1
+                self.retries += 1
+                if message.attempts >= MAX_ATTEMPTS:
+                    messages.popleft()
+                    self.pending -= 1
+                    self.dropped += 1
+                    logger.error(f"❌ Telegram: сообщение для {chat_id} отброшено после {message.attempts} попыток: {error}")
+                else:
+                    delay = max(delay, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** message.attempts))
+                    logger.warning(f"⚠️ Telegram: ошибка отправки в {chat_id} ({error}), повтор через {delay:.0f} сек")
+            except Exception as error:
+                messages.popleft()
+                self.pending -= 1
+                self.dropped += 1
+                logger.error(f"❌ Telegram: непредвиденная ошибка отправки в {chat_id}: {error}")
+            finally:
+                message.sending = False
+                # Учитываются и неудачные попытки: по ним видно деградацию Telegram API
+                TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started)
+
+            self._next_allowed[chat_id] = time.monotonic() + delay
+            self._scheduled.discard(chat_id)
+            if messages:
+                self._schedule(chat_id)
+            else:
+                del self._chats[chat_id]
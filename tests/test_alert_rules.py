@@ -0,0 +1,80 @@
+"""Правила оповещения: гистерезис, покрытие окна, отсутствие данных, правило по двум каналам"""
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from alert_rules import AlertEngine, DeviationRule, StaleRule, ThresholdRule
+from rolling_stats import ChannelHistory
+
+WINDOWS = {"5m": 300, "1h": 3600}
+
+
+def make_device(rules, channels=("tpod_so",), sample_period=10):
+    histories = {name: ChannelHistory(WINDOWS, sample_period) for name in channels}
+    return SimpleNamespace(histories=histories, alerts=AlertEngine(rules, set(channels)))
+
+
+def feed(device, values, now):
+    """Добавляет измерения всех каналов и возвращает события правил"""
+    for name, value in values.items():
+        device.histories[name].append(value, now)
+    return device.alerts.on_sample(device, list(values), now)
+
+
+def test_threshold_hysteresis():
+    rule = ThresholdRule("low_temp", "tpod_so", statistic="last", below=25.0, reset=30.0)
+    device = make_device([rule])
+    states = []
+    for index, value in enumerate((26.0, 24.9, 20.0, 25.0, 29.9, 30.0, 27.0, 24.0)):
+        events = feed(device, {"tpod_so": value}, 1000.0 + index * 10)
+        states.append([event.active for event in events])
+    # Срабатывает ниже 25, остается активным между 25 и 30, снимается с 30 и выше
+    assert states == [[], [True], [], [], [], [False], [], [True]]
+
+
+def test_threshold_waits_for_window_coverage():
+    # Как правило low_temp по умолчанию: среднее за час при покрытии окна не меньше 90%
+    rule = ThresholdRule("low_temp", "tpod_so", window="1h", below=25.0, reset=30.0, min_coverage=0.9)
+    device = make_device([rule])
+    fired = []
+    for index in range(400):
+        if feed(device, {"tpod_so": 20.0}, 1000.0 + index * 10):
+            fired.append(index)
+    # Вес каждого измерения - 10 сек, 90% часа покрыто на 324-м измерении
+    assert fired == [323]
+
+
+def test_stale_rule_fires_on_tick_and_clears_with_new_data():
+    rule = StaleRule("no_data", "tpod_so", max_age=600.0)
+    device = make_device([rule])
+    started = device.alerts.started
+    # Данных еще не было: возраст считается от запуска
+    assert device.alerts.on_tick(device, started + 599) == []
+    assert [event.active for event in device.alerts.on_tick(device, started + 601)] == [True]
+
+    device.histories["tpod_so"].append(40.0, started + 700)
+    assert [event.active for event in device.alerts.on_tick(device, started + 710)] == [False]
+    assert device.alerts.on_tick(device, started + 1290) == []
+    assert [event.active for event in device.alerts.on_tick(device, started + 1301)] == [True]
+
+
+def test_deviation_rule_is_evaluated_once_per_cycle():
+    rule = DeviationRule("mismatch", "tpod_so", "tvozd_kotel", max_delta=10.0, statistic="last")
+    device = make_device([rule], channels=("tpod_so", "tvozd_kotel"))
+    calls = []
+    evaluate = rule.evaluate
+
+    def counting_evaluate(device, now):
+        calls.append(now)
+        return evaluate(device, now)
+
+    rule.evaluate = counting_evaluate
+    events = feed(device, {"tpod_so": 40.0, "tvozd_kotel": 20.0}, 1000.0)
+    assert calls == [1000.0]
+    assert [(event.active, event.value) for event in events] == [(True, 20.0)]
+
+    events = feed(device, {"tpod_so": 30.0, "tvozd_kotel": 25.0}, 1010.0)
+    assert calls == [1000.0, 1010.0]
+    assert [event.active for event in events] == [False]
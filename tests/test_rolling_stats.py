@@ -0,0 +1,81 @@
+"""Скользящая статистика при вытеснении измерений из переполненного буфера"""
+import math
+import random
+import statistics
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rolling_stats import ChannelHistory
+
+
+def test_ring_overflow_keeps_window_stats_exact():
+    # Период опроса увеличен с 10 до 30 сек, а из журнала восстанавливаются измерения раз в 10 сек:
+    # буфер рассчитан на 1 час при 30 сек и переполняется, окно теряет самые старые измерения
+    rng = random.Random(0)
+    history = ChannelHistory({"1h": 3600}, sample_period=30)
+    values = [40 + 10 * math.sin(index / 50) + rng.gauss(0, 1) for index in range(720)]
+    for index, value in enumerate(values):
+        history.append(value, 1000.0 + index * 10)
+
+    kept = values[-history.ring.capacity:]
+    stats = history.stats("1h")
+    assert stats.count == len(kept)
+    assert math.isclose(stats.mean, statistics.fmean(kept), rel_tol=1e-9)
+    assert math.isclose(stats.variance, statistics.pvariance(kept), rel_tol=1e-6)
+    assert stats.min == min(kept)
+    assert stats.max == max(kept)
+
+
+def test_expire_without_new_samples_empties_stale_windows():
+    # Канал перестал получать измерения: окна сдвигаются только по времени чтения
+    history = ChannelHistory({"5m": 300, "1h": 3600}, sample_period=10)
+    for index in range(60):
+        history.append(40.0 + index, 1000.0 + index * 10)
+
+    history.expire(1590.0 + 600)
+    assert history.stats("5m").count == 0
+    stats = history.stats("1h")
+    assert stats.count == 60
+    assert stats.min == 40.0 and stats.max == 99.0
+
+    history.expire(1590.0 + 3600)
+    assert history.stats("1h").count == 0
+    assert history.last == 99.0
+
+
+def test_load_matches_appending_one_by_one():
+    # Восстановление из журнала: измерения чаще периода (буфер переполнен), пропуски и повторы времени
+    rng = random.Random(1)
+    times, timestamp = [], 1000.0
+    for _ in range(500):
+        timestamp += rng.choice((0.0, 5.0, 10.0, 10.0, 10.0, 200.0))
+        times.append(timestamp)
+    values = [rng.uniform(10, 60) for _ in times]
+
+    windows = {"5m": 300, "30m": 1800}
+    appended = ChannelHistory(windows, sample_period=30)
+    for timestamp, value in zip(times, values):
+        appended.append(value, timestamp)
+    loaded = ChannelHistory(windows, sample_period=30)
+    loaded.load(times, values)
+
+    assert_same_stats(loaded, appended, windows)
+    # После загрузки история продолжает обновляться как обычно
+    for history in (appended, loaded):
+        for index in range(20):
+            history.append(30.0 + index, times[-1] + 10 * (index + 1))
+    assert_same_stats(loaded, appended, windows)
+
+
+def assert_same_stats(actual_history, expected_history, windows):
+    assert actual_history.last == expected_history.last
+    assert actual_history.last_time == expected_history.last_time
+    for name in windows:
+        expected, actual = expected_history.stats(name), actual_history.stats(name)
+        assert actual.count == expected.count
+        assert actual.min == expected.min and actual.max == expected.max
+        assert math.isclose(actual.mean, expected.mean, rel_tol=1e-9)
+        assert math.isclose(actual.variance, expected.variance, rel_tol=1e-6)
+        assert math.isclose(actual.coverage, expected.coverage, rel_tol=1e-9)
@@ -0,0 +1,27 @@
+"""Журнал измерений: повторная запись измерения не искажает агрегаты"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sample_store import SampleStore
+
+
+def test_duplicate_samples_are_not_aggregated_twice(tmp_path):
+    store = SampleStore(str(tmp_path / "samples.db"))
+    hour = int(time.time() // 3600 * 3600)
+    for offset, value in enumerate((40.0, 42.0, 44.0)):
+        store.add("boiler_co_supply", hour + offset * 10, value)
+    assert store.flush() == 3
+    # То же измерение еще раз (например, после повторной отправки пачки) и одно новое
+    store.add("boiler_co_supply", hour, 99.0)
+    store.add("boiler_co_supply", hour + 30, 46.0)
+    store.add("boiler_co_supply", hour + 30, 46.0)
+    assert store.flush() == 1
+
+    assert store.load_range("boiler_co_supply", hour, hour + 60) == [
+        (hour, 40.0), (hour + 10, 42.0), (hour + 20, 44.0), (hour + 30, 46.0)
+    ]
+    assert store.query_buckets("boiler_co_supply", "1h", hour, hour + 3600) == [(hour, 4, 172.0, 40.0, 46.0)]
+    store.close()
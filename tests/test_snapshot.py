@@ -0,0 +1,48 @@
+"""Кэш отчетов по снимкам устройств"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fleet import Device, DeviceConfig
+from modbus_connection import STATE_CONNECTED
+from snapshot import ReportCache, SnapshotPublisher, snapshot_device
+
+GATEWAY_STATUS = {"state": STATE_CONNECTED, "reconnect_count": 0, "last_error": None}
+
+
+def make_device(name):
+    return Device(DeviceConfig(name=name, title=name, host="127.0.0.1", port=502, unit_id=1), {"1h": 3600})
+
+
+def test_report_is_cached_until_its_own_devices_change():
+    first, second = make_device("d1"), make_device("d2")
+    publisher = SnapshotPublisher()
+    publisher.publish(snapshot_device(first, GATEWAY_STATUS))
+    publisher.publish(snapshot_device(second, GATEWAY_STATUS))
+    cache = ReportCache()
+    renders = []
+
+    def render(snapshot):
+        renders.append(snapshot.version)
+        return f"report {snapshot.version}"
+
+    assert cache.get(publisher.current, ("d1",), "d1", render) == "report 2"
+    # Цикл другого устройства не сбрасывает отчет по d1
+    publisher.publish(snapshot_device(second, GATEWAY_STATUS))
+    assert cache.get(publisher.current, ("d1",), "d1", render) == "report 2"
+    assert cache.get(publisher.current, ("d1", "d2"), "all", render) == "report 3"
+    publisher.publish(snapshot_device(first, GATEWAY_STATUS))
+    assert cache.get(publisher.current, ("d1",), "d1", render) == "report 4"
+    assert renders == [2, 3, 4]
+
+
+def test_new_publisher_does_not_reuse_old_text():
+    cache = ReportCache()
+    texts = []
+    for run in range(2):
+        # Новый планировщик начинает нумерацию снимков парка заново
+        publisher = SnapshotPublisher()
+        publisher.publish(snapshot_device(make_device("d1"), GATEWAY_STATUS))
+        texts.append(cache.get(publisher.current, ("d1",), "d1", lambda snapshot, run=run: f"run {run}"))
+    assert texts == ["run 0", "run 1"]
@@ -0,0 +1,42 @@
+"""Очередь исходящих сообщений: оповещения и возвраты к норме, общая пауза при 429"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from telegram_outbox import TelegramOutbox, TokenBucket
+
+
+def test_recovery_cancels_unsent_alert_instead_of_replacing_it():
+    outbox = TelegramOutbox()
+    outbox.send(1, "⚠️ низкая температура", coalesce_key="low/d1/active", cancel_key="low/d1/clear")
+    outbox.send(2, "отчет")
+    # Возврат к норме, пока оповещение еще не отправлено: отбрасываются оба сообщения
+    outbox.send(1, "✅ возврат к норме", coalesce_key="low/d1/clear", cancel_key="low/d1/active")
+    assert [message.text for message in outbox._chats[1]] == []
+    assert outbox.pending == 1 and outbox.cancelled == 1
+
+    # Новое срабатывание ставится в очередь как обычно
+    outbox.send(1, "⚠️ снова низкая", coalesce_key="low/d1/active", cancel_key="low/d1/clear")
+    assert [message.text for message in outbox._chats[1]] == ["⚠️ снова низкая"]
+
+
+def test_recovery_after_sent_alert_is_queued():
+    outbox = TelegramOutbox()
+    outbox.send(1, "⚠️ низкая температура", coalesce_key="low/d1/active", cancel_key="low/d1/clear")
+    outbox._chats[1][0].sending = True
+    outbox.send(1, "✅ возврат к норме", coalesce_key="low/d1/clear", cancel_key="low/d1/active")
+    assert [message.text for message in outbox._chats[1]] == ["⚠️ низкая температура", "✅ возврат к норме"]
+
+
+def test_paused_bucket_holds_every_sender():
+    async def run():
+        bucket = TokenBucket(100.0)
+        bucket.pause(0.2)
+        started = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(3)))
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.2